@@ -1,26 +1,36 @@
 import os
 import pickle
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+import threading
+
+_credentials = None
+_lock = threading.Lock()
 
 def get_authenticated_service():
-    credentials = None
-    if os.path.exists('auth/credentials.pickle'):
-        with open('auth/credentials.pickle', 'rb') as token:
-            credentials = pickle.load(token)
-    if not credentials or not credentials.valid:
-        try:
-            credentials.refresh(Request())
-        except:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                "auth/client_secrets.json",
-                scopes=[
-                    "https://www.googleapis.com/auth/youtube.force-ssl",
-                    "https://www.googleapis.com/auth/youtube.upload"
-                ]
-            )
-            credentials = flow.run_local_server()
-        with open('auth/credentials.pickle', 'wb') as token:
-            pickle.dump(credentials, token)
-    return build('youtube', 'v3', credentials=credentials)
\ No newline at end of file
+    from googleapiclient.discovery import build
+    return build('youtube', 'v3', credentials=get_credentials())
+
+def get_credentials():
+    global _credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+    with _lock:
+        credentials = _credentials
+        if credentials is None and os.path.exists('auth/credentials.pickle'):
+            with open('auth/credentials.pickle', 'rb') as token:
+                credentials = pickle.load(token)
+        if not credentials or not credentials.valid:
+            try:
+                credentials.refresh(Request())
+            except:
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    "auth/client_secrets.json",
+                    scopes=[
+                        "https://www.googleapis.com/auth/youtube.force-ssl",
+                        "https://www.googleapis.com/auth/youtube.upload"
+                    ]
+                )
+                credentials = flow.run_local_server()
+            with open('auth/credentials.pickle', 'wb') as token:
+                pickle.dump(credentials, token)
+        _credentials = credentials
+        return credentials
@@ -0,0 +1,131 @@
+# classifier.py
+
+import os
+import json
+import time
+import argparse
+import statistics
+from PIL import Image
+from video_generator.util.classifier import load_classifier, classify_batch, MODELS, QUANTIZED_MODELS
+
+# Directory of the labeled images holding photos of no particular animal
+OFF_TOPIC = "off_topic"
+
+# Image file extensions included in the labeled set
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+def main():
+    # Parse the labeled image set and the backend configurations to compare
+    parser = argparse.ArgumentParser(description="Compare the accuracy and latency of the classifier backends on a labeled image set.")
+    parser.add_argument("directory", help=f"directory with a subdirectory of images per animal, and '{OFF_TOPIC}' for unrelated images")
+    parser.add_argument("--backends", nargs="*", help="configurations as backend[/quantization][/compilation], all by default")
+    parser.add_argument("--batch-size", type=int, default=4, help="images classified per forward pass, as in image retrieval")
+    parser.add_argument("--max-false-accepts", type=float, default=0.05, help="highest share of off-topic images a backend may accept")
+    parser.add_argument("--output", default="classifier.json", help="file to write the results to")
+    args = parser.parse_args()
+    
+    # Load the labeled images once for every configuration
+    samples = load_samples(args.directory)
+    animals = sorted({animal for animal, _ in samples if animal != OFF_TOPIC})
+    print(f"Loaded {len(samples)} images of {len(animals)} animals")
+    
+    # Measure every configuration, skipping those the installed torch cannot build
+    results = []
+    for configuration in args.backends or configurations():
+        try:
+            results.append(evaluate(configuration, samples, animals, args.batch_size))
+        except Exception as e:
+            print(f"Failed to evaluate {configuration}: {e}")
+    
+    # Recommend the fastest configuration that still rejects off-topic images
+    eligible = [result for result in results if result["false_accept_rate"] <= args.max_false_accepts]
+    best = min(eligible, key=lambda result: result["seconds_per_image"], default=None)
+    if best is not None:
+        print(f"Fastest backend within {args.max_false_accepts:.0%} false accepts: {best['configuration']}")
+    else:
+        print("No backend stays within the false accept limit")
+    
+    # Write the results
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump({"results": results, "recommended": best and best["configuration"]}, file, indent=2)
+    print(f"Successfully wrote classifier results: {args.output}")
+
+
+def configurations():
+    # Every model in float32, int8 and traced form
+    for backend in MODELS:
+        yield backend
+        yield f"{backend}/dynamic"
+        if backend in QUANTIZED_MODELS:
+            yield f"{backend}/static"
+        yield f"{backend}//torchscript"
+
+
+def parse(configuration):
+    # Split a configuration into its backend, quantization and compilation
+    parts = (configuration.split("/") + ["", ""])[:3]
+    return {"backend": parts[0], "quantization": parts[1], "compilation": parts[2]}
+
+
+def load_samples(directory):
+    # Pair every image with the animal named by its subdirectory
+    samples = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isdir(path):
+            continue
+        animal = name if name == OFF_TOPIC else name.replace("_", " ")
+        for file_name in sorted(os.listdir(path)):
+            if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                with Image.open(os.path.join(path, file_name)) as image:
+                    samples.append((animal, image.convert('RGB')))
+    return samples
+
+
+def evaluate(configuration, samples, animals, batch_size):
+    options = parse(configuration)
+    
+    # Load the model outside of the measured inference
+    start = time.perf_counter()
+    load_classifier(**options)
+    load_seconds = time.perf_counter() - start
+    
+    # Warm up the model so lazy initialization and compilation are not measured
+    classify_batch([samples[0][1]], animals[0] if animals else "", **options)
+    
+    # Classify the images in batches, timing each forward pass
+    latencies = []
+    true_accepts = false_rejects = false_accepts = true_rejects = 0
+    for index in range(0, len(samples), batch_size):
+        batch = samples[index:index + batch_size]
+        start = time.perf_counter()
+        results = classify_batch([image for _, image in batch], "", **options)
+        latencies.append((time.perf_counter() - start) / len(batch))
+        
+        for (animal, _), (_, predictions) in zip(batch, results):
+            # An image is accepted for an animal if its top label contains the animal, as in image retrieval
+            label = predictions[0][0].lower()
+            for candidate in animals:
+                accepted = candidate.lower() in label
+                if candidate == animal:
+                    true_accepts += accepted
+                    false_rejects += not accepted
+                else:
+                    false_accepts += accepted
+                    true_rejects += not accepted
+    
+    # Summarize the accuracy and latency of the configuration
+    result = {
+        "configuration": configuration,
+        "load_seconds": load_seconds,
+        "seconds_per_image": statistics.median(latencies),
+        "true_accept_rate": true_accepts / max(true_accepts + false_rejects, 1),
+        "false_accept_rate": false_accepts / max(false_accepts + true_rejects, 1),
+        "accuracy": (true_accepts + true_rejects) / max(true_accepts + false_rejects + false_accepts + true_rejects, 1)
+    }
+    print(f"{configuration}: {result['seconds_per_image'] * 1000:.1f} ms/image, accepts {result['true_accept_rate']:.0%} on-topic and {result['false_accept_rate']:.0%} off-topic")
+    return result
+
+
+if __name__ == "__main__":
+    main()
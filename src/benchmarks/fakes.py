@@ -0,0 +1,212 @@
+# fakes.py
+
+import io
+import os
+import sys
+import time
+import wave
+import types
+import base64
+import re
+import json
+import random
+import hashlib
+import itertools
+import numpy as np
+from functools import lru_cache, partial
+from PIL import Image
+
+# Simulated latency of every fake API call in seconds
+LATENCY = 0.0
+
+# Sample rate of the synthesized narration and the speaking speed used to size it
+SAMPLE_RATE = 24000
+CHARACTERS_PER_SECOND = 15
+
+# Length and format of the generated background music, which is not part of the repository
+MUSIC_SECONDS = 180
+MUSIC_FRAME_RATE = 44100
+MUSIC_CHANNELS = 2
+
+# Calls received by the fake upload sink
+uploads = []
+
+# Sequence numbering the generated image candidates
+_candidates = itertools.count()
+
+# Words the canned scripts are built from
+WORDS = ["the", "animal", "lives", "in", "dense", "forests", "and", "open", "plains", "where", "it", "hunts", "at", "dawn", "for", "small", "prey", "while", "its", "young", "stay", "hidden"]
+
+def install(latency=0.0):
+    # Replace the client modules with the fakes before the pipeline imports them
+    global LATENCY
+    LATENCY = latency
+    for name, module in build_modules().items():
+        sys.modules[f"video_generator.util.client.{name}"] = module
+    
+    # Replace the background music asset with a generated track
+    from video_generator import audio
+    audio.load_background_music = make_music
+    
+    # Build the classifier models with random weights so no pretrained weights are downloaded
+    from video_generator.util import classifier
+    classifier.load_model = partial(classifier.load_model, pretrained=False)
+
+
+def build_modules():
+    # Build a module exposing the same functions as each real client
+    modules = {}
+    for name, functions in {
+        "openai": [openai_response, openai_stream],
+        "google": [translate, synthesize_text],
+        "unsplash": [query_image, download_image],
+        "youtube": [upload_video, insert_captions, set_thumbnail, list_video_snippet],
+    }.items():
+        module = types.ModuleType(f"video_generator.util.client.{name}")
+        for function in functions:
+            setattr(module, function.__name__, function)
+        modules[name] = module
+    
+    # Expose the candidate class only where the real client defines it
+    modules["unsplash"].ImageCandidate = FakeCandidate
+    return modules
+
+
+def wait():
+    # Simulate the round trip of an API call
+    if LATENCY:
+        time.sleep(LATENCY)
+
+
+def seed(*values):
+    # Derive a stable seed so every run produces the same data
+    return int.from_bytes(hashlib.sha256(repr(values).encode('utf-8')).digest()[:4], 'big')
+
+
+def make_script(word_count, key="script"):
+    # Build a deterministic script of sentences with the requested number of words
+    generator = random.Random(seed(key, word_count))
+    sentences = []
+    remaining = word_count
+    while remaining > 0:
+        length = min(remaining, generator.randint(8, 20))
+        words = [generator.choice(WORDS) for _ in range(length)]
+        sentences.append(" ".join(words).capitalize() + ".")
+        remaining -= length
+    return " ".join(sentences)
+
+
+def make_image(width, height, key):
+    # Generate a smooth random image by upscaling a coarse grid of colors
+    generator = np.random.default_rng(seed(key, width, height))
+    grid = generator.integers(0, 256, size=(6, 8, 3), dtype=np.uint8)
+    return Image.fromarray(grid).resize((width, height), Image.BICUBIC)
+
+
+def make_tone(seconds, frequency=220):
+    # Synthesize a 16-bit mono sine tone encoded as base64 WAV content
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    samples = (np.sin(2 * np.pi * frequency * t) * 0.3 * 32767).astype(np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+@lru_cache(maxsize=None)
+def make_music():
+    # Generate a quiet stereo chord in the format of the real track, decoded once like it
+    from video_generator.audio import AudioTrack
+    t = np.arange(MUSIC_SECONDS * MUSIC_FRAME_RATE, dtype=np.float32) / MUSIC_FRAME_RATE
+    samples = (np.sin(2 * np.pi * 110 * t) + np.sin(2 * np.pi * 165 * t)) * np.float32(0.1)
+    return AudioTrack(np.repeat(samples[:, np.newaxis], MUSIC_CHANNELS, axis=1), MUSIC_FRAME_RATE)
+
+
+def openai_response(prompt, json_mode=False):
+    # Serve canned metadata in JSON mode
+    wait()
+    if json_mode:
+        return json.dumps({"title": make_script(6, prompt), "description": make_script(75, prompt), "tags": WORDS[:10]})
+    
+    # Serve a canned script of the requested length for script prompts and a short line for everything else
+    match = re.search(r'(\d+)-word essay', prompt)
+    return make_script(int(match.group(1)) if match else 12, prompt)
+
+
+def openai_stream(prompt):
+    # Stream the canned script in paragraphs of a few sentences
+    sentences = re.split(r'(?<=\.) ', openai_response(prompt))
+    for index in range(0, len(sentences), 4):
+        yield " ".join(sentences[index:index + 4]) + "\n\n"
+
+
+def translate(animal, script, language="en-GB"):
+    # Return the script unchanged as its translation
+    wait()
+    return script
+
+
+def synthesize_text(text, language="en-GB"):
+    # Synthesize a tone as long as the text would take to narrate
+    wait()
+    return make_tone(len(text) / CHARACTERS_PER_SECOND)
+
+
+def query_image(animal, width, height, stop=None):
+    # Return a candidate with mostly landscape dimensions so some are rejected by aspect ratio
+    wait()
+    index = next(_candidates)
+    generator = random.Random(seed(animal, index))
+    original_width = generator.choice([3000, 4000, 6000])
+    original_height = int(original_width / generator.choice([1.5, 1.78, 1.78, 0.67]))
+    candidate = FakeCandidate(f"{animal}-{index}", original_width, original_height)
+    return candidate
+
+
+def download_image(url, stop=None):
+    # Generate the image identified by the URL
+    wait()
+    return make_image(400, 267, url)
+
+
+def upload_video(animal, title, description, video_file_path, *args, **kwargs):
+    # Accept the video into the sink and return a fake video ID
+    wait()
+    uploads.append({"animal": animal, "title": title, "bytes": os.path.getsize(video_file_path)})
+    return f"fake-{len(uploads)}"
+
+
+def insert_captions(video_id, script, language, retried=False):
+    wait()
+
+
+def set_thumbnail(video_id, thumbnail):
+    wait()
+
+
+def list_video_snippet(video_id):
+    wait()
+    return {"thumbnails": {}}
+
+
+class FakeCandidate:
+    # Generated photo with the same interface as an Unsplash candidate
+    def __init__(self, id, width, height):
+        self.id = id
+        self.width = width
+        self.height = height
+    
+    @property
+    def size(self):
+        return (self.width, self.height)
+    
+    def preview(self, rendition="small", stop=None):
+        wait()
+        return make_image(400, int(400 * self.height / self.width), self.id)
+    
+    def fetch(self, width, height):
+        wait()
+        return make_image(width, height, self.id)
@@ -0,0 +1,293 @@
+# run.py
+
+import gc
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import traceback
+import statistics
+import numpy as np
+from unittest import mock
+from benchmarks import fakes
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Parameters each benchmark is run across
+IMAGE_COUNTS = [5, 20]
+RESOLUTIONS = [(640, 360), (1280, 720), (1920, 1080)]
+SCRIPT_WORDS = [150, 750, 1500]
+RENDER_BACKENDS = ["moviepy", "stream", "ffmpeg"]
+SECONDS_PER_IMAGE = 3
+
+def main():
+    # Parse the benchmarks to run and where to write the results
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against local stand-ins for the external services.")
+    parser.add_argument("benchmarks", nargs="*", help=f"benchmarks to run, all by default: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--repeats", type=int, default=3, help="measured runs per case")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated latency of every fake API call in seconds")
+    parser.add_argument("--output", default="benchmarks.json", help="file to write the results to")
+    parser.add_argument("--compare", help="results of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown or memory growth reported as a regression")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    
+    # Swap the API clients for the fakes before any pipeline module is imported
+    fakes.install(args.latency)
+    
+    # Run every case of the selected benchmarks
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.benchmarks or BENCHMARKS:
+            for params, function in BENCHMARKS[name](directory):
+                results.append(measure(name, params, function, args.repeats))
+    
+    # Write the results along with the environment they were measured in
+    data = {"environment": environment(args.latency), "results": results}
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=2)
+    print(f"Successfully wrote benchmark results: {args.output}")
+    
+    # Fail if any case regressed against the baseline
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        if compare(baseline["results"], results, args.threshold):
+            sys.exit(1)
+
+
+def measure(name, params, function, repeats):
+    # Run the case once untimed so lazily loaded models and caches do not skew the first run
+    function()
+    
+    # Time the runs untraced, since tracing allocations slows Python code far more than native code
+    wall, cpu = [], []
+    for _ in range(repeats):
+        gc.collect()
+        start_wall = time.perf_counter()
+        start_cpu = cpu_time()
+        function()
+        wall.append(time.perf_counter() - start_wall)
+        cpu.append(cpu_time() - start_cpu)
+    
+    # Measure the memory in a separate run
+    memory = measure_memory(function)
+    
+    # Summarize the runs of the case
+    result = {
+        "benchmark": name,
+        "params": params,
+        "repeats": repeats,
+        "median_seconds": statistics.median(wall),
+        "min_seconds": min(wall),
+        "cpu_seconds": statistics.median(cpu),
+        **memory
+    }
+    print(f"{key(result)}: {result['median_seconds']:.3f}s, {megabytes(result['peak_rss_bytes'])} MB, {megabytes(result['peak_child_rss_bytes'])} MB in subprocesses")
+    return result
+
+
+def cpu_time():
+    # CPU time of the process and of its finished subprocesses such as ffmpeg
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def measure_memory(function):
+    # Run the case in a forked child, whose peak resident memory starts from the current usage instead of the peak of earlier cases
+    if resource is None or not hasattr(os, "fork"):
+        return {"peak_rss_bytes": None, "peak_child_rss_bytes": None}
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read)
+            baseline = max_rss(resource.RUSAGE_SELF)
+            function()
+            
+            # Report the growth of the child, which includes torch's allocator, and the largest subprocess it ran such as ffmpeg
+            peak = max_rss(resource.RUSAGE_SELF)
+            children = max_rss(resource.RUSAGE_CHILDREN)
+            
+            # Linux charges a subprocess with the memory of the process that spawned it, so only a larger subprocess peak is its own
+            memory = {"peak_rss_bytes": max(peak - baseline, 0), "peak_child_rss_bytes": children if children > peak else None}
+            os.write(write, json.dumps(memory).encode('utf-8'))
+            status = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(status)
+    
+    # Read the measurements of the child once it exits
+    os.close(write)
+    with os.fdopen(read, 'rb') as file:
+        data = file.read()
+    _, status = os.waitpid(pid, 0)
+    if status != 0:
+        raise RuntimeError("Failed to measure the memory of the case")
+    return json.loads(data)
+
+
+def max_rss(who):
+    # Peak resident memory in bytes, reported in kilobytes everywhere but macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def megabytes(size):
+    return "n/a" if size is None else f"{size / 2 ** 20:.1f}"
+
+
+def key(result):
+    # Identify a case by its benchmark and parameters
+    return result["benchmark"] + " " + " ".join(f"{name}={value}" for name, value in sorted(result["params"].items()))
+
+
+def compare(baseline, results, threshold):
+    # Report every case that became slower or used more memory than the baseline
+    previous = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+        for metric in ("median_seconds", "peak_rss_bytes", "peak_child_rss_bytes"):
+            # Skip metrics missing from either run, such as memory on platforms without fork
+            if result.get(metric) is None or before.get(metric) is None:
+                continue
+            ratio = result[metric] / before[metric] if before[metric] else 1
+            if ratio > 1 + threshold:
+                regressions.append(f"{key(result)}: {metric} {before[metric]:.3f} -> {result[metric]:.3f} ({ratio:.2f}x)")
+    
+    # Print a summary of the comparison
+    for regression in regressions:
+        print(f"Regression in {regression}")
+    if not regressions:
+        print("Successfully compared results without regressions!")
+    return regressions
+
+
+def environment(latency):
+    # Record what the results depend on so only comparable runs are compared
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "latency": latency,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+
+def make_images(count, width, height, directory=None):
+    # Generate distinct images, written to disk if a directory is given
+    images = [fakes.make_image(width, height, f"image-{index}") for index in range(count)]
+    if directory is None:
+        return images
+    paths = []
+    for index, image in enumerate(images):
+        path = os.path.join(directory, f"{width}x{height}-{index:03d}.jpg")
+        image.save(path, quality=95)
+        paths.append(path)
+    return paths
+
+
+def make_audio(seconds):
+    # Decode a synthesized tone into an audio track
+    from video_generator.audio import AudioTrack, decode_chunk
+    pcm = bytearray()
+    params = decode_chunk(fakes.make_tone(seconds), pcm)
+    samples = np.frombuffer(pcm, dtype=np.int16).reshape(-1, params.nchannels).astype(np.float32) / 32768
+    return AudioTrack(samples, params.framerate)
+
+
+def retrieve_images_cases(directory):
+    from video_generator import media
+    
+    def run(image_count, width, height, spool):
+        # Accept every preview so the case measures retrieval rather than the model, and start each run with an empty hash index
+        accept = lambda images, animal: [(True, [])] * len(images)
+        with tempfile.TemporaryDirectory(dir=directory) as run_directory:
+            with mock.patch.object(media, "HASH_INDEX_DIR", run_directory):
+                media.retrieve_images("benchmark", image_count, width, height, classify=accept, spool_dir=os.path.join(run_directory, "images") if spool else None)
+    
+    for image_count in IMAGE_COUNTS:
+        for width, height in RESOLUTIONS:
+            for spool in (False, True):
+                yield {"image_count": image_count, "resolution": f"{width}x{height}", "spool": spool}, lambda image_count=image_count, width=width, height=height, spool=spool: run(image_count, width, height, spool)
+
+
+def classify_image_cases(directory):
+    # The fakes build the model with random weights, so the latency is measured without downloading pretrained weights
+    from video_generator.util.classifier import classify_image
+    for width, height in RESOLUTIONS:
+        image = make_images(1, width, height)[0]
+        yield {"resolution": f"{width}x{height}"}, lambda image=image: classify_image(image, "benchmark")
+
+
+def generate_audio_cases(directory):
+    from video_generator.audio import generate_audio, generate_audio_stream
+    for words in SCRIPT_WORDS:
+        script = fakes.make_script(words)
+        yield {"words": words}, lambda script=script: generate_audio(script)
+        
+        # Synthesize the script while it streams in, as the pipeline does
+        prompt = f"Write a {words}-word essay"
+        yield {"words": words, "streamed": True}, lambda prompt=prompt: generate_audio_stream(fakes.openai_stream(prompt))
+
+
+def create_video_cases(directory):
+    from video_generator.video import create_video, render_video
+    
+    def run(audio, images, backend):
+        # Compose and render the video into a temporary file that is removed afterwards
+        with render_video(create_video(audio, images, backend)):
+            pass
+    
+    for image_count in IMAGE_COUNTS:
+        audio = make_audio(image_count * SECONDS_PER_IMAGE)
+        for width, height in RESOLUTIONS:
+            images = make_images(image_count, width, height, directory)
+            for backend in RENDER_BACKENDS:
+                yield {"image_count": image_count, "resolution": f"{width}x{height}", "backend": backend}, lambda audio=audio, images=images, backend=backend: run(audio, images, backend)
+
+
+def create_thumbnail_cases(directory):
+    from video_generator.util.thumbnail import create_thumbnail
+    for image_count in IMAGE_COUNTS:
+        for width, height in RESOLUTIONS:
+            images = make_images(image_count, width, height, directory)
+            yield {"image_count": image_count, "resolution": f"{width}x{height}"}, lambda images=images: create_thumbnail("benchmark", None, images)
+
+
+def startup_cases(directory):
+    # Start a fresh interpreter for each run, since imports are cached within a process
+    commands = {
+        "import": [sys.executable, "-c", "import video_generator.pipeline"],
+        "help": [sys.executable, "main.py", "--help"],
+    }
+    for name, command in commands.items():
+        yield {"command": name}, lambda command=command: subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+
+
+# Generators of the parameterized cases of each benchmark
+BENCHMARKS = {
+    "startup": startup_cases,
+    "retrieve_images": retrieve_images_cases,
+    "classify_image": classify_image_cases,
+    "generate_audio": generate_audio_cases,
+    "create_video": create_video_cases,
+    "create_thumbnail": create_thumbnail_cases,
+}
+
+if __name__ == "__main__":
+    main()
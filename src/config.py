@@ -10,3 +10,64 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
 UNSPLASH_API_KEY = os.getenv('UNSPLASH_API_KEY')
+
+# Number of CPU threads used for image classification (0 keeps the torch default)
+TORCH_NUM_THREADS = int(os.getenv('TORCH_NUM_THREADS', 0))
+
+# Image classification model ("resnet18", "resnet50", "resnet152", "mobilenet_v3" or "efficientnet"),
+# int8 quantization ("", "dynamic" or "static") and compilation ("", "torchscript" or "compile")
+CLASSIFIER_BACKEND = os.getenv('CLASSIFIER_BACKEND', 'resnet152')
+CLASSIFIER_QUANTIZATION = os.getenv('CLASSIFIER_QUANTIZATION', '')
+CLASSIFIER_COMPILATION = os.getenv('CLASSIFIER_COMPILATION', '')
+
+# Directory for on-disk caches shared between runs
+CACHE_DIR = os.getenv('CACHE_DIR', 'cache')
+
+# Clients whose API responses are cached on disk, e.g. "openai,google,unsplash"
+CACHE_CLIENTS = {client.strip() for client in os.getenv('CACHE_CLIENTS', '').split(',') if client.strip()}
+
+# Maximum age in seconds and total size in bytes of the cached API responses
+CACHE_TTL = int(os.getenv('CACHE_TTL', 30 * 24 * 3600))
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+# Maximum number of languages translated and captioned concurrently
+CAPTION_CONCURRENCY = int(os.getenv('CAPTION_CONCURRENCY', 5))
+
+# Maximum size in bytes of the text sent in a single text-to-speech request, and the number of concurrent requests
+TTS_CHUNK_BYTES = int(os.getenv('TTS_CHUNK_BYTES', 4500))
+TTS_CONCURRENCY = int(os.getenv('TTS_CONCURRENCY', 4))
+
+# Video rendering backend ("moviepy", "stream" or "ffmpeg"), ffmpeg executable and encoder threads (0 lets ffmpeg decide)
+RENDER_BACKEND = os.getenv('RENDER_BACKEND', 'moviepy')
+FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+RENDER_THREADS = int(os.getenv('RENDER_THREADS', 0))
+
+# Size in bytes of each resumable YouTube upload request (a multiple of 256 KB)
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+
+# Number of workers for network-bound and CPU-bound pipeline stages in batch runs
+IO_WORKERS = int(os.getenv('IO_WORKERS', 8))
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', 1))
+
+# Directory where the output of each pipeline stage is persisted per video
+RUNS_DIR = os.getenv('RUNS_DIR', 'runs')
+
+# Timeouts in seconds for connecting to and reading from the APIs, and retries of failed connections
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 60))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 2))
+
+# Keep-alive connections per host without a dedicated pool size
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+
+# Connections the asynchronous clients open at once across all hosts, however many requests are awaited
+HTTP_ASYNC_CONNECTIONS = int(os.getenv('HTTP_ASYNC_CONNECTIONS', 100))
+
+# Number of Unsplash API requests allowed per hour (50 in demo mode)
+UNSPLASH_REQUESTS_PER_HOUR = int(os.getenv('UNSPLASH_REQUESTS_PER_HOUR', 50))
+
+# Source of the thumbnail image: "local" picks the best video image, "youtube" waits for YouTube's frame
+THUMBNAIL_SOURCE = os.getenv('THUMBNAIL_SOURCE', 'youtube')
+
+# Record stage timings, resource usage and API calls for the run report
+INSTRUMENTATION = os.getenv('INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
@@ -1,22 +1,58 @@
 # main.py
 
-from video_generator.script import generate_script
-from video_generator.audio import generate_audio
-from video_generator.media import retrieve_images
-from video_generator.video import curate_video
+import argparse
+from video_generator.pipeline import run_video, run_batch, STAGES
+from video_generator.util import instrumentation
 
 # Define the main function
 def main():
+    # Parse the animals to generate videos about
+    parser = argparse.ArgumentParser(description="Generate Animal Expedition videos.")
+    parser.add_argument("animals", nargs="*", help="animals to generate videos about")
+    parser.add_argument("--file", help="file with one animal per line")
+    parser.add_argument("--stage", choices=STAGES, default="finish", help="stop once this stage and the stages it depends on are done")
+    parser.add_argument("--report", help="write a JSON report of stage timings, resources and API calls")
+    parser.add_argument("--metrics", help="write the same measurements in the Prometheus text format")
+    args = parser.parse_args()
+    
+    # Record measurements only if a report was requested or instrumentation is configured
+    if args.report or args.metrics:
+        instrumentation.enable()
+    try:
+        generate(args)
+    finally:
+        # Write the measurements even if the run failed
+        if args.report:
+            instrumentation.write_report(args.report)
+        if args.metrics:
+            instrumentation.write_prometheus(args.metrics)
+        
+        # Print the measurements if instrumentation was configured without an output file
+        if instrumentation.is_enabled() and not (args.report or args.metrics):
+            instrumentation.print_summary()
+
+
+def generate(args):
+    # Collect the animals from the command line and the file
+    animals = list(args.animals)
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as file:
+            animals += [line.strip() for line in file if line.strip()]
+    
+    # Generate all videos from one process if a batch was given
+    if animals:
+        run_batch(animals, args.stage)
+        return
+    
     # Prompt the user to input the desired animal
     animal = input("Animal: ")
     
-    # Generate and retrieve the script, audio, and images
-    script = generate_script(animal)
-    audio = generate_audio(script)
-    images = retrieve_images(animal)
+    # Generate the script, audio, images, and metadata concurrently and curate the video
+    result = run_video(animal, args.stage)
     
-    # Curate the video using the generated script, audio, and retrieved images
-    curate_video(animal, script, audio, images)
+    # Print the output of a text stage that was run on its own
+    if isinstance(result, str):
+        print(result)
 
 
 if __name__ == "__main__":
@@ -1,20 +1,79 @@
 # audio.py
 
 import io
+import re
+import wave
 import base64
-from pydub import AudioSegment
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from video_generator.util.client.google import synthesize_text
+from video_generator.util.instrumentation import timed
+from config import TTS_CHUNK_BYTES, TTS_CONCURRENCY
 
+# Path to the background music mixed under the narration
+BACKGROUND_MUSIC_PATH = "video_generator/assets/media/background.mp3"
+
+# Background music decoded once in its own format, shared across the process
+_background_music = None
+_background_lock = threading.Lock()
+
+@timed("audio")
 def generate_audio(script):
-    # Synthesize text to audio
-    synthesized_text = synthesize_text(script)
+    # Split the script into chunks that fit within a single synthesis request
+    chunks = split_script(script)
+    
+    # Synthesize the chunks concurrently
+    with ThreadPoolExecutor(max_workers=TTS_CONCURRENCY) as executor:
+        futures = [executor.submit(synthesize_text, chunk) for chunk in chunks]
+        
+        # Combine the synthesized chunks in order
+        return assemble_audio(futures)
+
+
+def generate_audio_stream(pieces):
+    # Synthesize the script while it streams in
+    with ThreadPoolExecutor(max_workers=TTS_CONCURRENCY) as executor:
+        script, futures = submit_audio_stream(pieces, executor)
+        
+        # Combine the synthesized chunks in order
+        return script, assemble_audio(futures)
+
+
+@timed("narration")
+def submit_audio_stream(pieces, executor):
+    # Collect the streamed pieces to return the complete script
+    received = []
+    
+    def receive():
+        for piece in pieces:
+            received.append(piece)
+            yield piece
+    
+    # Submit each paragraph for synthesis as soon as it is complete, while the rest of the script streams in
+    futures = []
+    for paragraph in split_paragraphs(receive()):
+        futures += [executor.submit(synthesize_text, chunk) for chunk in split_script(paragraph)]
+    
+    # Return the script once the stream ends, along with the chunks still being synthesized
+    return "".join(received), futures
+
+
+def assemble_audio(futures):
+    # Decode the chunks in order and append their samples to a single PCM buffer, releasing each payload once decoded
+    pcm = bytearray()
+    params = None
+    while futures:
+        params = decode_chunk(futures.pop(0).result(), pcm)
     
-    # Decode the base64-encoded audio content
-    audio_content_byte = base64.b64decode(synthesized_text)
+    # Fail clearly if the script had no text to synthesize
+    if params is None:
+        raise ValueError("Cannot synthesize audio from an empty script")
     
-    # Load the audio content as an AudioSegment object
-    audio_content = io.BytesIO(audio_content_byte)
-    audio = AudioSegment.from_file(audio_content, format="wav")
+    # Convert the 16-bit PCM buffer to a float array of shape (frames, channels)
+    samples = np.frombuffer(pcm, dtype=np.int16).reshape(-1, params.nchannels).astype(np.float32)
+    samples /= 32768
+    audio = AudioTrack(samples, params.framerate)
     
     # Add background music to the audio
     audio = add_background_music(audio)
@@ -24,24 +83,195 @@ def generate_audio(script):
     return audio
 
 
-def add_background_music(audio):
-    # Get the duration of the main audio
-    main_duration = len(audio)
+def split_paragraphs(pieces):
+    # Yield every paragraph of the streamed text once the line break ending it has arrived
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        *paragraphs, buffer = buffer.split("\n")
+        for paragraph in paragraphs:
+            if paragraph.strip():
+                yield paragraph.strip()
+    
+    # Yield the last paragraph once the stream ends
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def split_script(script, max_bytes=TTS_CHUNK_BYTES):
+    # Split the script into sentences
+    sentences = re.split(r'(?<=[.!?])\s+', script.strip())
+    
+    chunks = []
+    chunk = ""
+    for sentence in sentences:
+        # Split sentences that are too long on their own at word boundaries
+        for part in split_sentence(sentence, max_bytes):
+            candidate = f"{chunk} {part}" if chunk else part
+            if chunk and len(candidate.encode('utf-8')) > max_bytes:
+                # Start a new chunk once the current one is full
+                chunks.append(chunk)
+                chunk = part
+            else:
+                chunk = candidate
+    if chunk:
+        chunks.append(chunk)
+    
+    # Return the list of chunks
+    return chunks
+
+
+def split_sentence(sentence, max_bytes):
+    # Return the sentence as-is if it fits within a single chunk
+    if len(sentence.encode('utf-8')) <= max_bytes:
+        return [sentence]
+    
+    # Otherwise group its words into parts that fit, hard splitting words too long for a chunk of their own
+    parts = []
+    part = ""
+    for word in sentence.split():
+        for piece in split_word(word, max_bytes):
+            candidate = f"{part} {piece}" if part else piece
+            if part and len(candidate.encode('utf-8')) > max_bytes:
+                parts.append(part)
+                part = piece
+            else:
+                part = candidate
+    if part:
+        parts.append(part)
+    return parts
+
+
+def split_word(word, max_bytes):
+    # Return the word as-is if it fits within a single chunk
+    if len(word.encode('utf-8')) <= max_bytes:
+        return [word]
     
-    # Load the background music
-    background_music = AudioSegment.from_file("video_generator/assets/media/background.mp3", format="mp3")
+    # Otherwise cut it at character boundaries so no piece exceeds the limit once encoded
+    pieces = []
+    piece = ""
+    size = 0
+    for character in word:
+        character_size = len(character.encode('utf-8'))
+        if piece and size + character_size > max_bytes:
+            pieces.append(piece)
+            piece, size = "", 0
+        piece += character
+        size += character_size
+    pieces.append(piece)
+    return pieces
+
+
+def decode_chunk(synthesized_text, pcm):
+    # Decode the base64-encoded WAV content of the chunk
+    with wave.open(io.BytesIO(base64.b64decode(synthesized_text))) as wav:
+        # Append the raw samples to the PCM buffer
+        pcm.extend(wav.readframes(wav.getnframes()))
+        
+        # Return the audio parameters of the chunk
+        return wav.getparams()
+
+
+@timed("mix")
+def add_background_music(audio, gain_db=-6, fade_ms=5000):
+    # Load the background music in its own sample rate and channels
+    background_music = load_background_music()
     
-    # Decrease the volume of the background music
-    background_music = background_music - 6
+    # Mix at the higher sample rate and channel count of the two tracks like pydub's overlay, upsampling the narration once
+    frame_rate = max(audio.frame_rate, background_music.frame_rate)
+    channels = max(audio.channels, background_music.channels)
+    audio = audio.convert(frame_rate, channels)
+    background_music = background_music.convert(frame_rate, channels)
     
     # Crop the background music to match the duration of the main audio
-    background_music = background_music[:main_duration]
+    frames = min(len(background_music.samples), len(audio.samples))
+    
+    # Decrease the volume of the background music into a single mixing buffer
+    music = np.multiply(background_music.samples[:frames], np.float32(10 ** (gain_db / 20)))
     
-    # Apply fade-in and fade-out effects to the background music
-    background_music = background_music.fade_in(5000).fade_out(5000)
+    # Apply linear fade-in and fade-out envelopes to the background music
+    fade_frames = min(int(audio.frame_rate * fade_ms / 1000), frames)
+    envelope = np.linspace(0, 1, fade_frames, dtype=np.float32)[:, np.newaxis]
+    music[:fade_frames] *= envelope
+    music[frames - fade_frames:] *= envelope[::-1]
     
-    # Overlay the background music onto the main audio
-    main_audio = audio.overlay(background_music)
+    # Mix the background music into the main audio in place
+    audio.samples[:frames] += music
+    np.clip(audio.samples, -1, 1, out=audio.samples)
     
     # Return the combined audio
-    return main_audio
+    return audio
+
+
+def load_audio(path):
+    # Read a 16-bit WAV file written by AudioTrack.export
+    with wave.open(path, 'rb') as wav:
+        pcm = wav.readframes(wav.getnframes())
+        channels = wav.getnchannels()
+        frame_rate = wav.getframerate()
+    
+    # Convert the samples to a float array of shape (frames, channels)
+    samples = np.frombuffer(pcm, dtype=np.int16).reshape(-1, channels).astype(np.float32)
+    samples /= 32768
+    return AudioTrack(samples, frame_rate)
+
+
+def load_background_music():
+    global _background_music
+    with _background_lock:
+        if _background_music is None:
+            # Decode the background music once, keeping its own sample rate and channels
+            from pydub import AudioSegment
+            music = AudioSegment.from_file(BACKGROUND_MUSIC_PATH, format="mp3")
+            
+            # Convert the samples to a float array of shape (frames, channels)
+            samples = np.array(music.get_array_of_samples(), dtype=np.float32).reshape(-1, music.channels)
+            samples /= 2 ** (8 * music.sample_width - 1)
+            _background_music = AudioTrack(samples, music.frame_rate)
+        return _background_music
+
+
+class AudioTrack:
+    # Audio samples held as a float array of shape (frames, channels) in the range [-1, 1]
+    def __init__(self, samples, frame_rate):
+        self.samples = samples
+        self.frame_rate = frame_rate
+    
+    @property
+    def channels(self):
+        return self.samples.shape[1]
+    
+    @property
+    def duration_seconds(self):
+        return len(self.samples) / self.frame_rate
+    
+    def convert(self, frame_rate, channels):
+        # Return the track unchanged if it is already in the requested format
+        samples = self.samples
+        if frame_rate == self.frame_rate and channels == self.channels:
+            return self
+        
+        # Resample each channel with linear interpolation, like pydub's set_frame_rate
+        if frame_rate != self.frame_rate:
+            positions = np.arange(int(round(len(samples) * frame_rate / self.frame_rate))) * (self.frame_rate / frame_rate)
+            source = np.arange(len(samples))
+            samples = np.stack([np.interp(positions, source, samples[:, channel]) for channel in range(self.channels)], axis=1).astype(np.float32)
+        
+        # Duplicate a mono track into every channel, like pydub's set_channels
+        if channels != self.channels:
+            if self.channels != 1:
+                raise ValueError(f"Cannot convert audio from {self.channels} to {channels} channels")
+            samples = np.repeat(samples, channels, axis=1)
+        return AudioTrack(samples, frame_rate)
+    
+    def to_pcm(self):
+        # Convert the samples to 16-bit PCM bytes
+        return (self.samples * 32767).astype(np.int16).tobytes()
+    
+    def export(self, path, format="wav"):
+        # Write the samples to a 16-bit WAV file
+        with wave.open(path, 'wb') as wav:
+            wav.setnchannels(self.channels)
+            wav.setsampwidth(2)
+            wav.setframerate(self.frame_rate)
+            wav.writeframes(self.to_pcm())
@@ -0,0 +1,163 @@
+# checkpoint.py
+
+import os
+import json
+import time
+import hashlib
+import threading
+from PIL import Image
+from video_generator.audio import load_audio
+from video_generator.video import VideoArtifact
+from config import RUNS_DIR
+
+class RunDirectory:
+    # Directory persisting the output of each pipeline stage of a video, with a manifest of content hashes
+    def __init__(self, path):
+        self.path = path
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self.lock = threading.Lock()
+        
+        # Load the manifest of a previous attempt if there is one
+        os.makedirs(path, exist_ok=True)
+        self.manifest = {"stages": {}, "state": {}, "finished": False}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                self.manifest = json.load(file)
+    
+    @classmethod
+    def open(cls, animal, root=RUNS_DIR):
+        # Resume the latest unfinished run for the animal, or start a new one
+        animal_dir = os.path.join(root, cls.slug(animal))
+        runs = sorted(int(name) for name in os.listdir(animal_dir) if name.isdigit()) if os.path.isdir(animal_dir) else []
+        if runs:
+            run = cls(os.path.join(animal_dir, f"{runs[-1]:03d}"))
+            if not run.manifest["finished"]:
+                print(f"Resuming run: {run.path}")
+                return run
+        return cls(os.path.join(animal_dir, f"{(runs[-1] if runs else 0) + 1:03d}"))
+    
+    @staticmethod
+    def slug(animal):
+        # Name of the directory holding the runs of an animal
+        return animal.lower().replace(' ', '_')
+    
+    def file(self, name):
+        return os.path.join(self.path, name)
+    
+    def stage(self, name, compute, save=None, load=None):
+        # Skip the stage if its output was persisted and is unchanged
+        with self.lock:
+            entry = self.manifest["stages"].get(name)
+        if entry is not None and entry["hash"] == self.hash(entry["files"], entry["value"]):
+            print(f"Skipping completed stage: {name}")
+            return load(self) if load else entry["value"]
+        
+        # Run the stage and persist its output as files or as a manifest value
+        result = compute()
+        files = save(self, result) if save else []
+        value = None if save else result
+        with self.lock:
+            self.manifest["stages"][name] = {
+                "files": files,
+                "value": value,
+                "hash": self.hash(files, value),
+                "completed": time.time()
+            }
+            self.save()
+        return result
+    
+    def get(self, key, default=None):
+        # Read intermediate state such as per-language caption status
+        with self.lock:
+            return self.manifest["state"].get(key, default)
+    
+    def set(self, key, value):
+        with self.lock:
+            self.manifest["state"][key] = value
+            self.save()
+    
+    def finish(self):
+        # Mark the run as finished so the next invocation starts a new run
+        with self.lock:
+            self.manifest["finished"] = True
+            self.save()
+    
+    def hash(self, files, value):
+        # Hash the content of the output files and the output value
+        digest = hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8'))
+        for name in files:
+            path = self.file(name)
+            if not os.path.exists(path):
+                return None
+            digest.update(name.encode('utf-8'))
+            with open(path, 'rb') as file:
+                for block in iter(lambda: file.read(1024 * 1024), b''):
+                    digest.update(block)
+        return digest.hexdigest()
+    
+    def save(self):
+        # Write the manifest atomically so an interrupted run never leaves it corrupted
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.manifest, file, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+
+def save_script(run, script):
+    with open(run.file("script.txt"), 'w', encoding='utf-8') as file:
+        file.write(script)
+    return ["script.txt"]
+
+
+def load_script(run):
+    with open(run.file("script.txt"), 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+def save_audio(run, audio):
+    audio.export(run.file("audio.wav"), format="wav")
+    return ["audio.wav"]
+
+
+def load_audio_file(run):
+    return load_audio(run.file("audio.wav"))
+
+
+def save_images(run, images):
+    # Write the accepted images in order, unless they were already spooled into the run directory
+    os.makedirs(run.file("images"), exist_ok=True)
+    names = []
+    for index, image in enumerate(images):
+        if isinstance(image, str):
+            names.append(os.path.relpath(image, run.path))
+            continue
+        name = os.path.join("images", f"{index:03d}.jpg")
+        image.save(run.file(name), quality=95)
+        names.append(name)
+    return names
+
+
+def load_images(run):
+    # Return the paths of the images so they are only decoded when needed
+    names = run.manifest["stages"]["images"]["files"]
+    return [run.file(name) for name in names]
+
+
+def save_video(run, artifact):
+    # The video is rendered straight into the run directory
+    return [os.path.relpath(artifact.path, run.path)]
+
+
+def load_video(run):
+    return VideoArtifact(run.file("video.mp4"))
+
+
+def save_thumbnail(run, thumbnail):
+    # Keep the thumbnail lossless, since it is encoded as JPEG when it is uploaded
+    thumbnail.save(run.file("thumbnail.png"))
+    return ["thumbnail.png"]
+
+
+def load_thumbnail(run):
+    with Image.open(run.file("thumbnail.png")) as thumbnail:
+        return thumbnail.convert("RGB")
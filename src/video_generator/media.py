@@ -1,40 +1,157 @@
 # images.py
 
-import time
+import os
+import json
+import queue
+import threading
+import requests
+import numpy as np
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, UnidentifiedImageError
+from config import CACHE_DIR
 from video_generator.util.client.unsplash import query_image
-from video_generator.util.classifier import classify_image
+from video_generator.util.client.ratelimit import Cancelled
+from video_generator.util.classifier import classify_batch
+from video_generator.util.instrumentation import timed, count
 
-def retrieve_images(animal, image_count=20, width=1280, height=720):
-    images = []
-    while len(images) != image_count:
+# Directory where the perceptual hashes of used images are stored per animal
+HASH_INDEX_DIR = os.path.join(CACHE_DIR, "hashes")
+
+@timed("images")
+def retrieve_images(animal, image_count=20, width=1280, height=720, workers=4, batch_size=4, query=query_image, classify=classify_batch, hash_threshold=10, spool_dir=None):
+    # Load the hashes of images already used for this animal
+    index = HashIndex.load(animal)
+    
+    # Bounded queue connecting the preview download workers to the classifier stage
+    candidates = queue.Queue(maxsize=workers * 2)
+    stop = threading.Event()
+    
+    # Start the Unsplash download workers
+    executor = ThreadPoolExecutor(max_workers=workers)
+    for _ in range(workers):
+        executor.submit(fetch_images, animal, width, height, query, candidates, stop)
+    
+    accepted = []
+    try:
+        while len(accepted) < image_count:
+            # Pull a micro-batch of downloaded previews for classification
+            batch = next_batch(candidates, batch_size)
+            
+            # Classify the retrieved previews in a single pass
+            results = classify([preview for _, preview in batch], animal)
+            for (candidate, preview), (match, _) in zip(batch, results):
+                if not match:
+                    count("images_rejected", reason="classification")
+                    continue
+                if len(accepted) == image_count:
+                    continue
+                
+                # Reject images that are near-duplicates of already used images
+                image_hash = dhash(preview)
+                if index.contains(image_hash, hash_threshold):
+                    print("Image already in list")
+                    count("images_rejected", reason="duplicate")
+                    continue
+                
+                # Keep the candidate for the final download
+                index.add(image_hash)
+                accepted.append(candidate)
+    finally:
+        # Stop fetching as soon as enough images have been accepted, without joining workers still waiting for the rate limit
+        stop.set()
+        drain(candidates)
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    # Download only the accepted images at the final size, spooling them to disk if requested
+    if spool_dir is not None:
+        os.makedirs(spool_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers) as downloader:
+        images = list(downloader.map(partial(download_accepted_image, width, height, spool_dir), range(len(accepted)), accepted))
+    
+    # Persist the hashes once every accepted image is downloaded, so a failed download does not burn them for future videos
+    index.save()
+    
+    # Return the list of retrieved images, or their paths if spooled
+    print(f"Successfully retrieved {len(images)} images!")
+    return images
+
+
+def download_accepted_image(width, height, spool_dir, index, candidate):
+    # Convert the image to the RGB color mode
+    image = candidate.fetch(width, height).convert('RGB')
+    if spool_dir is None:
+        return image
+    
+    # Write the image to disk and keep only its path
+    path = os.path.join(spool_dir, f"{index:03d}.jpg")
+    image.save(path, quality=95)
+    return path
+
+
+def fetch_images(animal, width, height, query, candidates, stop):
+    while not stop.is_set():
         try:
             # Query an image related to the animal from Unsplash API
-            image = query_image(animal, width, height)
+            candidate = query(animal, width, height, stop=stop)
             
-            # Classify the retrieved image
-            if classify_image(image, animal):
-                # Check if the image can be resized within a certain aspect ratio threshold
-                if resize_within_threshold(image, width, height):
-                    image = image.resize((width, height))
-                    if image not in images:
-                        # Append the resized image to the list of images
-                        images.append(image)
-                    else:
-                        print("Image already in list")
+            # Check if the image can be resized within a certain aspect ratio threshold using its metadata
+            if not resize_within_threshold(candidate, width, height):
+                count("images_rejected", reason="aspect_ratio")
+                continue
+            
+            # Download a small rendition for classification, skipping photos that cannot be downloaded or decoded
+            try:
+                preview = candidate.preview(stop=stop)
+            except (requests.HTTPError, UnidentifiedImageError) as e:
+                print(f"Skipping image {candidate.id}: {e}")
+                count("images_rejected", reason="download")
+                continue
+        except Cancelled:
+            # The retrieval was stopped while waiting for the rate limit
+            return
         except Exception as e:
-            # Handle exception when no Unsplash API requests are remaining
-            print(f"No Unsplash API Requests Remaining: {e}")
+            # Hand the error over to the classifier stage so the retrieval fails instead of stalling
+            put(candidates, e, stop)
+            return
+        
+        # Hand the image over to the classifier stage
+        put(candidates, (candidate, preview), stop)
 
-            # Sleep until more image queries are available
-            remaining_seconds = 3600 - (time.localtime().tm_min * 60 + time.localtime().tm_sec) + 5
-            time.sleep(remaining_seconds)
-    
-    # Convert all images to the RGB color mode
-    images = [image.convert('RGB') for image in images]
+
+def put(candidates, item, stop):
+    # Wait while the queue is full unless the retrieval is stopped
+    while not stop.is_set():
+        try:
+            candidates.put(item, timeout=1)
+            return
+        except queue.Full:
+            continue
+
+
+def next_batch(candidates, batch_size):
+    # Block for the first image, then take whatever else is already waiting
+    batch = [candidates.get()]
+    while len(batch) < batch_size:
+        try:
+            batch.append(candidates.get_nowait())
+        except queue.Empty:
+            break
     
-    # Return the list of retrieved images
-    print(f"Successfully retrieved {len(images)} images!")
-    return images
+    # Raise any error reported by the download workers
+    for item in batch:
+        if isinstance(item, Exception):
+            raise item
+    return batch
+
+
+def drain(candidates):
+    # Discard any images left in the queue so blocked workers can exit
+    while True:
+        try:
+            candidates.get_nowait()
+        except queue.Empty:
+            return
 
 
 def resize_within_threshold(image, target_width=1280, target_height=720, aspect_ratio_threshold=0.4):
@@ -53,3 +170,79 @@ def resize_within_threshold(image, target_width=1280, target_height=720, aspect_
     else:
         print("Image could not be resized!")
         return False
+
+
+def dhash(image, hash_size=8):
+    # Reduce the image to a small grayscale thumbnail one pixel wider than the hash
+    pixels = np.asarray(image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS), dtype=np.int16)
+    
+    # Compare horizontally adjacent pixels to get the gradient bits
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    
+    # Pack the bits into a 64-bit integer
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), 'big')
+
+
+def hamming_distance(a, b):
+    # Count the number of differing bits between two hashes
+    return bin(a ^ b).count('1')
+
+
+class HashIndex:
+    # BK-tree of perceptual hashes supporting sub-linear near-duplicate lookups
+    def __init__(self, path=None):
+        self.path = path
+        self.root = None
+        self.hashes = []
+    
+    @classmethod
+    def load(cls, animal):
+        # Load the index persisted for the given animal, if any
+        path = os.path.join(HASH_INDEX_DIR, f"{animal.lower().replace(' ', '_')}.json")
+        index = cls(path)
+        if os.path.exists(path):
+            with open(path) as f:
+                for image_hash in json.load(f):
+                    index.add(image_hash)
+        return index
+    
+    def save(self):
+        # Write the hashes back to disk
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self.hashes, f)
+    
+    def add(self, image_hash):
+        self.hashes.append(image_hash)
+        if self.root is None:
+            self.root = (image_hash, {})
+            return
+        
+        # Walk down the tree following the edge labelled with the distance to each node
+        node = self.root
+        while True:
+            distance = hamming_distance(image_hash, node[0])
+            if distance == 0:
+                return
+            if distance not in node[1]:
+                node[1][distance] = (image_hash, {})
+                return
+            node = node[1][distance]
+    
+    def contains(self, image_hash, threshold=10):
+        if self.root is None:
+            return False
+        
+        # Only visit children whose edge distance can satisfy the triangle inequality
+        nodes = [self.root]
+        while nodes:
+            node_hash, children = nodes.pop()
+            distance = hamming_distance(image_hash, node_hash)
+            if distance <= threshold:
+                return True
+            for edge, child in children.items():
+                if distance - threshold <= edge <= distance + threshold:
+                    nodes.append(child)
+        return False
@@ -0,0 +1,221 @@
+# pipeline.py
+
+import threading
+from functools import partial
+from operator import itemgetter
+from concurrent.futures import Future, ThreadPoolExecutor
+from video_generator.script import generate_script, stream_script
+from video_generator.audio import generate_audio, submit_audio_stream, assemble_audio
+from video_generator.media import retrieve_images
+from video_generator.util.classifier import classify_batch
+from video_generator.video import create_video, render_video, publish_video, publish_captions, LANGUAGE_CODES
+from video_generator.checkpoint import RunDirectory, save_script, load_script, save_audio, load_audio_file, save_images, load_images, save_video, load_video, save_thumbnail, load_thumbnail
+from video_generator.util.metadata import get_metadata
+from video_generator.util.thumbnail import curate_thumbnail, create_thumbnail
+from video_generator.util.client.youtube import set_thumbnail
+from config import IO_WORKERS, CPU_WORKERS, THUMBNAIL_SOURCE, TTS_CONCURRENCY
+
+# Stages that can be selected as the target of a run, in pipeline order
+STAGES = ["script", "audio", "images", "metadata", "video", "video_id", "thumbnail", "captions", "finish"]
+
+def run_video(animal, target="finish"):
+    # Run the stages of a single video concurrently, bounded by the critical path
+    with Scheduler() as scheduler:
+        return schedule_video(scheduler, animal, target).result()
+
+
+def run_batch(animals, target="finish"):
+    # Schedule each animal once, since animals sharing a run directory would write the same stage files
+    unique = {}
+    for animal in animals:
+        if RunDirectory.slug(animal) in unique:
+            print(f"Skipping duplicate animal: {animal}")
+            continue
+        unique[RunDirectory.slug(animal)] = animal
+    
+    # Schedule the pipeline of every video up front so their stages overlap
+    with Scheduler() as scheduler:
+        videos = {animal: schedule_video(scheduler, animal, target) for animal in unique.values()}
+        
+        # Wait for each video to finish and collect the results
+        report = {}
+        for animal, future in videos.items():
+            try:
+                report[animal] = {"status": "succeeded", "result": future.result()}
+            except Exception as e:
+                print(f"Failed to generate video about {animal}: {e}")
+                report[animal] = {"status": "failed", "error": str(e)}
+    
+    # Print a summary of the batch
+    succeeded = sum(1 for result in report.values() if result["status"] == "succeeded")
+    print(f"Successfully generated {succeeded}/{len(report)} videos!")
+    return report
+
+
+def schedule_video(scheduler, animal, target="finish"):
+    # Persist the output of every stage so a failed run resumes from the first incomplete stage
+    run = RunDirectory.open(animal)
+    
+    # Each stage is defined by the pool it runs on, its function and the stages it depends on
+    stages = {
+        # Stream the script into speech synthesis so the audio is ready shortly after the script
+        "narration": ("io", partial(narrate, run, animal), []),
+        "script": ("io", itemgetter(0), ["narration"]),
+        "audio": ("io", itemgetter(1), ["narration"]),
+        
+        # Retrieve the images independently of the script, spooling them into the run directory and classifying them on the cpu pool
+        "images": ("io", checkpointed(run, "images", partial(retrieve_images, animal, classify=partial(scheduler.run, "cpu", classify_batch), spool_dir=run.file("images")), save_images, load_images), []),
+        
+        # Generate the title, description and tags in a single request independently of the media
+        "metadata": ("io", checkpointed(run, "metadata", partial(get_metadata, animal)), []),
+        
+        # Render the video into the run directory once the audio and images are ready
+        "video": ("cpu", checkpointed(run, "video", partial(render, run), save_video, load_video), ["audio", "images"]),
+        
+        # Upload the video once it is rendered and its metadata is ready
+        "video_id": ("io", checkpointed(run, "video_id", partial(upload, animal)), ["video", "metadata"]),
+        
+        # Add the captions to the published video
+        "captions": ("io", partial(publish_remaining_captions, run, animal), ["script", "video_id"]),
+        
+        # Mark the run as finished once everything is published
+        "finish": ("io", partial(finish, run), ["captions", "thumbnail"]),
+    }
+    
+    # Create the thumbnail from the images while the video renders and uploads, or poll YouTube for its frame
+    if THUMBNAIL_SOURCE == "local":
+        stages["thumbnail_image"] = ("cpu", checkpointed(run, "thumbnail_image", partial(create_thumbnail, animal, None), save_thumbnail, load_thumbnail), ["images"])
+        stages["thumbnail"] = ("io", checkpointed(run, "thumbnail", set_thumbnail), ["video_id", "thumbnail_image"])
+    else:
+        stages["thumbnail"] = ("io", checkpointed(run, "thumbnail", partial(curate_thumbnail, animal)), ["video_id"])
+    
+    # Generate only the script without synthesizing it if the run stops after the script
+    if target == "script":
+        stages["script"] = ("io", checkpointed(run, "script", partial(generate_script, animal), save_script, load_script), [])
+    
+    # Submit only the target stage and the stages it depends on, leaving the run open if it stops early
+    return submit_stage(scheduler, stages, target, {})
+
+
+def submit_stage(scheduler, stages, name, futures):
+    # Submit the dependencies of a stage first, sharing the futures of stages needed by several others
+    if name not in futures:
+        kind, function, dependencies = stages[name]
+        futures[name] = scheduler.submit(kind, function, *[submit_stage(scheduler, stages, dependency, futures) for dependency in dependencies])
+    return futures[name]
+
+
+def checkpointed(run, name, function, save=None, load=None):
+    # Wrap a stage so it is skipped when its output was persisted by a previous attempt
+    return lambda *args: run.stage(name, partial(function, *args), save, load)
+
+
+def narrate(run, animal):
+    # Stream the script into speech synthesis unless the script was persisted by a previous attempt
+    with ThreadPoolExecutor(max_workers=TTS_CONCURRENCY) as executor:
+        narration = {}
+        
+        def stream():
+            script, narration["futures"] = submit_audio_stream(stream_script(animal), executor)
+            return script
+        
+        # Persist the script as soon as the stream ends, so a failed synthesis does not pay for the script again
+        script = run.stage("script", stream, save_script, load_script)
+        
+        # Synthesize a persisted script from scratch, otherwise assemble the audio synthesized while streaming
+        audio = run.stage("audio", lambda: assemble_audio(narration["futures"]) if "futures" in narration else generate_audio(script), save_audio, load_audio_file)
+    return script, audio
+
+
+def render(run, audio, images):
+    # Create and render the video into the run directory
+    return render_video(create_video(audio, images), output_path=run.file("video.mp4"))
+
+
+def upload(animal, artifact, metadata):
+    # Publish the rendered video, removing it afterwards if it is a temporary file
+    with artifact:
+        return publish_video(animal, artifact.path, metadata)
+
+
+def publish_remaining_captions(run, animal, script, video_id):
+    # Only publish the captions of languages that did not succeed in a previous attempt
+    report = run.get("captions", {})
+    languages = [language for language in LANGUAGE_CODES if report.get(language, {}).get("status") != "succeeded"]
+    report.update(publish_captions(animal, script, video_id, languages))
+    run.set("captions", report)
+    
+    # Fail the stage so the next attempt retries the failed languages
+    failed = [language for language in LANGUAGE_CODES if report[language]["status"] != "succeeded"]
+    if failed:
+        raise RuntimeError(f"Failed to publish captions for: {', '.join(failed)}")
+    return report
+
+
+def finish(run, captions, thumbnail):
+    # Start a new run for this animal next time
+    run.finish()
+    print(f"Successfully finished run: {run.path}")
+    return captions
+
+
+class Scheduler:
+    # Runs each stage on the worker pool for its kind once the stages it depends on have finished
+    def __init__(self, io_workers=IO_WORKERS, cpu_workers=CPU_WORKERS):
+        self.pools = {
+            "io": ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="io"),
+            "cpu": ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="cpu"),
+        }
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.shutdown()
+    
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown(wait=True)
+    
+    def run(self, kind, function, *args):
+        # Run a step of a stage on the pool of another kind and wait for its result
+        return self.pools[kind].submit(function, *args).result()
+    
+    def submit(self, kind, function, *dependencies):
+        # The stage receives the results of its dependencies as arguments
+        future = Future()
+        remaining = [len(dependencies)]
+        lock = threading.Lock()
+        
+        def start():
+            # Propagate the failure of a dependency instead of running the stage
+            for dependency in dependencies:
+                if dependency.exception() is not None:
+                    future.set_exception(dependency.exception())
+                    return
+            
+            # Run the stage on its pool without blocking a worker while waiting for dependencies
+            stage = self.pools[kind].submit(function, *[dependency.result() for dependency in dependencies])
+            stage.add_done_callback(partial(complete, future))
+        
+        def on_dependency_done(_):
+            with lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                start()
+        
+        if dependencies:
+            for dependency in dependencies:
+                dependency.add_done_callback(on_dependency_done)
+        else:
+            start()
+        return future
+
+
+def complete(future, stage):
+    # Copy the outcome of a finished stage onto the future returned by the scheduler
+    if stage.exception() is not None:
+        future.set_exception(stage.exception())
+    else:
+        future.set_result(stage.result())
@@ -1,25 +1,24 @@
 # script.py
 
-from video_generator.util.client.openai import openai_response
+from video_generator.util.client.openai import openai_response, openai_stream
+from video_generator.util.prompts import load_prompt
+from video_generator.util.instrumentation import timed
 
+@timed("script")
 def generate_script(animal, word_count=750):
-    # Path to the file containing the script prompt
-    prompt_path = "video_generator/assets/prompts/script_prompt.txt"
+    # Fill the word count and animal into the compiled script prompt
+    prompt = load_prompt("script").render(WORD_COUNT=word_count, ANIMAL_NAME=animal)
     
-    # Open the script prompt file and read its content
-    with open(prompt_path, 'r', encoding='utf-8') as file:
-        prompt = file.read()
-    
-    # Replace placeholders in the script prompt with actual values
-    prompt = prompt.replace('WORD_COUNT', str(word_count))
-    prompt = prompt.replace('ANIMAL_NAME', animal)
-    
-    # Generate a script using OpenAI's API based on the modified prompt
+    # Generate a script using OpenAI's API based on the prompt
     script = openai_response(prompt)
     
-    # Decode the script from bytes to UTF-8 string format
-    script = script.encode('utf-8').decode('utf-8')
-    
     # Return the generated script
     print("Successfully generated script!")
     return script
+
+
+def stream_script(animal, word_count=750):
+    # Yield the script as it is generated so speech synthesis can start on its first paragraphs
+    prompt = load_prompt("script").render(WORD_COUNT=word_count, ANIMAL_NAME=animal)
+    yield from openai_stream(prompt)
+    print("Successfully generated script!")
@@ -1,51 +1,137 @@
 # classifier.py
 
 import json
-import torch
-from torchvision import models, transforms
+import threading
+from config import TORCH_NUM_THREADS, CLASSIFIER_BACKEND, CLASSIFIER_QUANTIZATION, CLASSIFIER_COMPILATION
+from video_generator.util.instrumentation import timed
 
-def classify_image(image, expected_animal):
-    # Open the labels JSON file and load the labels
-    with open("video_generator/assets/labels/labels.json") as f:
-        labels = json.load(f)
-    
-    # Check if the expected animal is present in the loaded labels
-    return auto_image_classifier(image, labels, expected_animal)
+# Path to the ImageNet labels used to interpret the model output
+LABELS_PATH = "video_generator/assets/labels/labels.json"
 
+# Names of the torchvision ImageNet models of each backend
+MODELS = {
+    "resnet18": "resnet18",
+    "resnet50": "resnet50",
+    "resnet152": "resnet152",
+    "mobilenet_v3": "mobilenet_v3_large",
+    "efficientnet": "efficientnet_b0",
+}
 
-def auto_image_classifier(image, labels, expected_animal):
-    # Load the pretrained ResNet-152 model
-    model = models.resnet152(pretrained=True)
-    
-    # Set the model to evaluation mode
-    model.eval()
+# Backends with a statically quantized int8 model in torchvision
+QUANTIZED_MODELS = {
+    "resnet18": "resnet18",
+    "resnet50": "resnet50",
+    "mobilenet_v3": "mobilenet_v3_large",
+}
+
+# Process-wide classifiers per backend configuration, loaded lazily on first use
+_classifiers = {}
+_lock = threading.Lock()
+
+
+def classify_image(image, expected_animal, **options):
+    # Classify a single image and check if it matches the expected animal
+    match, _ = classify_batch([image], expected_animal, **options)[0]
+    return match
+
+
+@timed("classify")
+def classify_batch(images, expected_animal, top_k=5, **options):
+    import torch
     
-    # Define image preprocessing transformations
-    preprocess = transforms.Compose([
-        transforms.Resize(256),
-        transforms.CenterCrop(224),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-    ])
+    # Load the model, labels and preprocessing pipeline once per process
+    model, labels, preprocess = load_classifier(**options)
     
-    # Preprocess the image
-    img_tensor = preprocess(image)
-    img_tensor = torch.unsqueeze(img_tensor, 0)
+    # Preprocess every image and stack them into a single batch tensor
+    batch = torch.stack([preprocess(image.convert('RGB')) for image in images])
     
-    # Perform inference using the model
+    # Perform inference for the whole batch in a single forward pass
     with torch.no_grad():
-        output = model(img_tensor)
+        output = model(batch)
+    
+    # Convert the logits to probabilities and get the top-k predictions
+    probabilities = torch.nn.functional.softmax(output, dim=1)
+    scores, indices = torch.topk(probabilities, top_k, dim=1)
     
-    # Get the index of the predicted class
-    _, predicted_idx = torch.max(output, 1)
+    results = []
+    for image_scores, image_indices in zip(scores.tolist(), indices.tolist()):
+        # Pair each predicted label with its score
+        predictions = [(labels[index], score) for index, score in zip(image_indices, image_scores)]
+        
+        # Check if the top predicted label contains the expected animal
+        predicted_label = predictions[0][0]
+        match = expected_animal.lower() in predicted_label.lower()
+        if not match:
+            # Print a message if the image classification identifies an incorrect value
+            print(f"Image classification identified an incorrect value: {predicted_label}")
+        
+        results.append((match, predictions))
     
-    # Get the predicted label corresponding to the predicted index
-    predicted_label = labels[predicted_idx.item()]
+    # Return the match flag and top-k predictions for each image
+    return results
+
+
+def load_classifier(backend=CLASSIFIER_BACKEND, quantization=CLASSIFIER_QUANTIZATION, compilation=CLASSIFIER_COMPILATION):
+    key = (backend, quantization, compilation)
+    with _lock:
+        if key not in _classifiers:
+            # Import PyTorch on first use, since importing it takes seconds
+            import torch
+            from torchvision import transforms
+            
+            # Limit the number of threads used for CPU inference if configured
+            if TORCH_NUM_THREADS:
+                torch.set_num_threads(TORCH_NUM_THREADS)
+            
+            # Open the labels JSON file and load the labels
+            with open(LABELS_PATH) as f:
+                labels = json.load(f)
+            
+            # Define image preprocessing transformations
+            preprocess = transforms.Compose([
+                transforms.Resize(256),
+                transforms.CenterCrop(224),
+                transforms.ToTensor(),
+                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+            ])
+            
+            # Load the model of the backend and keep it for every later batch
+            _classifiers[key] = (load_model(backend, quantization, compilation), labels, preprocess)
+    return _classifiers[key]
+
+
+def load_model(backend, quantization, compilation, pretrained=True):
+    import torch
+    from torchvision import models
+    
+    # Check the backend configuration before downloading any weights
+    if backend not in MODELS:
+        raise ValueError(f"Unknown classifier backend: {backend}")
+    if quantization not in ("", "dynamic", "static"):
+        raise ValueError(f"Unknown classifier quantization: {quantization}")
+    if compilation not in ("", "torchscript", "compile"):
+        raise ValueError(f"Unknown classifier compilation: {compilation}")
+    if quantization == "static" and backend not in QUANTIZED_MODELS:
+        raise ValueError(f"No statically quantized model for classifier backend: {backend}")
     
-    # Check if the predicted label contains the expected animal
-    if expected_animal.lower() in predicted_label.lower():
-        return True
+    # Load the pretrained model, already quantized to int8 if requested, and set it to evaluation mode
+    if quantization == "static":
+        model = getattr(models.quantization, QUANTIZED_MODELS[backend])(pretrained=pretrained, quantize=True)
     else:
-        # Print a message if the image classification identifies an incorrect value
-        print(f"Image classification identified an incorrect value: {predicted_label}")
-        return False
+        model = getattr(models, MODELS[backend])(pretrained=pretrained)
+    model.eval()
+    
+    # Quantize the weights of the fully connected layers to int8, computing activations in float
+    if quantization == "dynamic":
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    
+    # Trace the model into a frozen TorchScript graph, or let torch.compile optimize it on the first batch
+    if compilation == "torchscript":
+        with torch.no_grad():
+            model = torch.jit.freeze(torch.jit.trace(model, torch.zeros(1, 3, 224, 224)))
+    elif compilation == "compile":
+        model = torch.compile(model)
+    
+    # Print the loaded backend configuration
+    print(f"Successfully loaded classifier: {'/'.join(part for part in (backend, quantization, compilation) if part)}")
+    return model
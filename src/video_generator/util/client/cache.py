@@ -0,0 +1,159 @@
+# cache.py
+
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from config import CACHE_DIR, CACHE_CLIENTS, CACHE_TTL, CACHE_MAX_BYTES
+
+# Process-wide response cache, created lazily on first use
+_cache = None
+_cache_lock = threading.Lock()
+
+def cached(client, endpoint, params, fetch, binary=False):
+    # Return the cached response if available
+    response = lookup(client, endpoint, params, binary)
+    if response is not None:
+        return response
+    
+    # Call the API and store the response for later runs
+    response = fetch()
+    store(client, endpoint, params, response, binary)
+    return response
+
+
+async def cached_async(client, endpoint, params, fetch, binary=False):
+    # Return the cached response if available, reading the cache off the event loop
+    response = await asyncio.to_thread(lookup, client, endpoint, params, binary)
+    if response is not None:
+        return response
+    
+    # Await the API and store the response for later runs
+    response = await fetch()
+    await asyncio.to_thread(store, client, endpoint, params, response, binary)
+    return response
+
+
+def lookup(client, endpoint, params, binary=False):
+    # Nothing is cached for clients without caching enabled
+    if client not in CACHE_CLIENTS:
+        return None
+    
+    # Look up the response by the hash of the endpoint and its parameters
+    cache = get_cache()
+    data = cache.get(cache.key(endpoint, params))
+    if data is None:
+        return None
+    return data if binary else json.loads(data)
+
+
+def store(client, endpoint, params, response, binary=False):
+    if client not in CACHE_CLIENTS:
+        return
+    cache = get_cache()
+    cache.put(client, cache.key(endpoint, params), response if binary else json.dumps(response).encode('utf-8'))
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(os.path.join(CACHE_DIR, "responses"), CACHE_TTL, CACHE_MAX_BYTES)
+    return _cache
+
+
+class ResponseCache:
+    # Content-addressed store with a SQLite index and one blob file per distinct response
+    def __init__(self, directory, ttl, max_bytes):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        
+        # Open the index and create the entries table if needed
+        os.makedirs(os.path.join(directory, "blobs"), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, client TEXT, digest TEXT, size INTEGER, created REAL, accessed REAL)"
+        )
+        self.db.commit()
+    
+    def key(self, endpoint, params):
+        # Canonicalize the parameters so equivalent requests share a key
+        canonical = json.dumps(params, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(f"{endpoint}\n{canonical}".encode('utf-8')).hexdigest()
+    
+    def blob_path(self, digest):
+        return os.path.join(self.directory, "blobs", digest[:2], digest)
+    
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT digest, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            digest, created = row
+            
+            # Drop the entry if it has expired or its blob has gone missing
+            path = self.blob_path(digest)
+            if time.time() - created > self.ttl or not os.path.exists(path):
+                self.remove(key, digest)
+                self.db.commit()
+                return None
+            
+            # Record the access for least-recently-used eviction
+            self.db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+            with open(path, 'rb') as f:
+                return f.read()
+    
+    def put(self, client, key, data):
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            # Write the blob once per distinct content
+            path = self.blob_path(digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            
+            # Point the request key at the blob
+            now = time.time()
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries (key, client, digest, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, client, digest, len(data), now, now)
+            )
+            self.evict()
+            self.db.commit()
+    
+    def evict(self):
+        # Remove expired entries
+        expired = self.db.execute("SELECT key, digest FROM entries WHERE created < ?", (time.time() - self.ttl,)).fetchall()
+        for key, digest in expired:
+            self.remove(key, digest)
+        
+        # Remove least recently used entries until the store fits within the size limit
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM entries)").fetchone()[0]
+        rows = self.db.execute("SELECT key, digest, size FROM entries ORDER BY accessed").fetchall()
+        for key, digest, size in rows:
+            if total <= self.max_bytes:
+                break
+            if self.remove(key, digest):
+                total -= size
+    
+    def remove(self, key, digest):
+        self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        
+        # Delete the blob once no other key references it
+        if self.db.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone() is None:
+            try:
+                os.remove(self.blob_path(digest))
+            except FileNotFoundError:
+                pass
+            return True
+        return False
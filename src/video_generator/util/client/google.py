@@ -1,44 +1,59 @@
 # google.py
 
 import html
-import requests
 from config import GOOGLE_API_KEY
+from video_generator.util.client import transport
+from video_generator.util.client.cache import cached, cached_async
+from video_generator.util.client.ratelimit import call, call_async, raise_for_status
+from video_generator.util.instrumentation import count
 
 def translate(animal, script, language="en-GB"):
+    # Build the translation request, keeping the original script if no translation is needed
+    url, params = translation_request(script, language)
+    if params is None:
+        return script
+    
+    # Get the translated text from the cache or the translation API
+    script = cached("google", url, params, lambda: request_translation(url, params))
+    return unescape_translation(script, language)
+
+
+async def translate_async(animal, script, language="en-GB"):
+    # Build the translation request, keeping the original script if no translation is needed
+    url, params = translation_request(script, language)
+    if params is None:
+        return script
+    
+    # Await the translated text from the cache or the translation API
+    script = await cached_async("google", url, params, lambda: request_translation_async(url, params))
+    return unescape_translation(script, language)
+
+
+def translation_request(script, language):
     # Define the source language as English
     source = "en"
     
     # Extract the target language code from the provided language string
     target = language.split('-')[0].strip()
     
-    # If the target language is the same as the source language, return the original script
-    if target == source:
-        return script
-    
     # Construct the URL for the translation API
     url = "https://translation.googleapis.com/language/translate/v2"
     
+    # If the target language is the same as the source language, there is nothing to request
+    if target == source:
+        return url, None
+    
     # Set parameters for the translation request
     params = {
-        "key": GOOGLE_API_KEY,
         "q": script,
         "source": source,
         "target": target,
         "contentType": "text"
     }
-    
-    # Send a POST request to the translation API
-    response = requests.post(url, params=params)
-    
-    # Raise an exception for HTTP errors
-    response.raise_for_status()
-    
-    # Parse the JSON response
-    translation_data = response.json()
-    
-    # Extract the translated text from the response data
-    script = translation_data["data"]["translations"][0]["translatedText"]
-    
+    return url, params
+
+
+def unescape_translation(script, language):
     # Unescape HTML entities in the translated text
     translation = html.unescape(script)
     
@@ -47,7 +62,39 @@ def translate(animal, script, language="en-GB"):
     return translation
 
 
+def request_translation(url, params):
+    # Send a POST request to the translation API within the rate limit
+    response = call("google", lambda: post(url, params={"key": GOOGLE_API_KEY, **params}))
+    return parse_translation(response)
+
+
+async def request_translation_async(url, params):
+    # Await a POST request to the translation API within the rate limit
+    response = await call_async("google", lambda: post_async(url, params={"key": GOOGLE_API_KEY, **params}))
+    return parse_translation(response)
+
+
+def parse_translation(response):
+    # Parse the JSON response
+    translation_data = response.json()
+    
+    # Extract the translated text from the response data
+    return translation_data["data"]["translations"][0]["translatedText"]
+
+
 def synthesize_text(text, language="en-GB"):
+    # Return the cached audio content if available, otherwise request it
+    url, data = synthesis_request(text, language)
+    return cached("google", url, data, lambda: request_synthesis(url, data))
+
+
+async def synthesize_text_async(text, language="en-GB"):
+    # Return the cached audio content if available, otherwise await it
+    url, data = synthesis_request(text, language)
+    return await cached_async("google", url, data, lambda: request_synthesis_async(url, data))
+
+
+def synthesis_request(text, language):
     # Define the URL for the Text-to-Speech API
     url = "https://texttospeech.googleapis.com/v1/text:synthesize"
     
@@ -62,18 +109,36 @@ def synthesize_text(text, language="en-GB"):
             "pitch": 2
         },
     }
-    
-    # Set parameters for the API request
-    params = {"key": GOOGLE_API_KEY}
-    
-    # Send a POST request to the Text-to-Speech API
-    response = requests.post(url, params=params, json=data)
-    
-    # Raise an exception for HTTP errors
-    response.raise_for_status()
+    return url, data
+
+
+def request_synthesis(url, data):
+    # Send a POST request to the Text-to-Speech API within the rate limit
+    response = call("google", lambda: post(url, params={"key": GOOGLE_API_KEY}, json=data))
     
     # Parse the JSON response and extract the audio content
-    synthesized_text = response.json()["audioContent"]
+    return response.json()["audioContent"]
+
+
+async def request_synthesis_async(url, data):
+    # Await a POST request to the Text-to-Speech API within the rate limit
+    response = await call_async("google", lambda: post_async(url, params={"key": GOOGLE_API_KEY}, json=data))
     
-    # Return the synthesized audio content
-    return synthesized_text
+    # Parse the JSON response and extract the audio content
+    return response.json()["audioContent"]
+
+
+def post(url, **kwargs):
+    # Send a POST request and raise an exception for HTTP errors
+    response = transport.post(url, **kwargs)
+    raise_for_status(response, "google")
+    count("bytes_downloaded", len(response.content), client="google")
+    return response
+
+
+async def post_async(url, **kwargs):
+    # Await a POST request and raise an exception for HTTP errors
+    response = await transport.post_async(url, **kwargs)
+    raise_for_status(response, "google")
+    count("bytes_downloaded", len(response.content), client="google")
+    return response
@@ -1,20 +1,196 @@
 # openai.py
 
-import openai
-from config import OPENAI_API_KEY
-
-def openai_response(prompt):
-    # Create an OpenAI client with the provided API key
-    ai_client = openai.OpenAI(api_key=OPENAI_API_KEY)
-    
-    # Send the prompt to the chat completion endpoint of the GPT-3.5-turbo model
-    response = ai_client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt}
-        ]
-    )
+import time
+import asyncio
+import weakref
+import threading
+from contextlib import contextmanager
+from config import OPENAI_API_KEY, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+from video_generator.util.client import transport
+from video_generator.util.client.cache import cached, cached_async, lookup, store
+from video_generator.util.client.ratelimit import call, call_async, get_limiter, QuotaExceeded, TransientError
+from video_generator.util.instrumentation import count, record_call
+
+# Model used for every request
+MODEL = "gpt-3.5-turbo"
+
+# Process-wide OpenAI client, created on first use so its connection pool is reused
+_client = None
+_lock = threading.Lock()
+
+# Asynchronous OpenAI clients, one per event loop, sharing the connections of the asynchronous transport
+_async_clients = weakref.WeakKeyDictionary()
+
+def openai_response(prompt, json_mode=False):
+    # Define the chat messages and, in JSON mode, constrain the response to a single JSON object
+    messages = build_messages(prompt)
+    options = {"response_format": {"type": "json_object"}} if json_mode else {}
+    
+    # Return the cached response content if available, otherwise request it
+    return cached("openai", "chat.completions", {"model": MODEL, "messages": messages, **options},
+                  lambda: call("openai", lambda: create_completion(MODEL, messages, **options)))
+
+
+async def openai_response_async(prompt, json_mode=False):
+    # Define the chat messages and, in JSON mode, constrain the response to a single JSON object
+    messages = build_messages(prompt)
+    options = {"response_format": {"type": "json_object"}} if json_mode else {}
+    
+    # Return the cached response content if available, otherwise await it
+    return await cached_async("openai", "chat.completions", {"model": MODEL, "messages": messages, **options},
+                              lambda: call_async("openai", lambda: create_completion_async(MODEL, messages, **options)))
+
+
+def openai_stream(prompt):
+    # Yield the cached response content in one piece if available
+    messages = build_messages(prompt)
+    params = {"model": MODEL, "messages": messages}
+    content = lookup("openai", "chat.completions", params)
+    if content is not None:
+        yield content
+        return
+    
+    # Otherwise yield the content as it is generated, opening the stream within the rate limit
+    stream = call("openai", lambda: create_completion(MODEL, messages, stream=True))
+    parts = []
+    chunks = iter(stream)
+    elapsed = 0.0
+    while True:
+        # Time only the wait for the next chunk of the body, not the consumer's work between pieces
+        start = time.perf_counter()
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            break
+        except Exception:
+            record_call("openai_stream", elapsed + time.perf_counter() - start, succeeded=False)
+            raise
+        finally:
+            elapsed += time.perf_counter() - start
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            yield parts[-1]
+    
+    # Record the time spent reading the body and store the complete response under the same key as a non-streamed request
+    record_stream(elapsed, parts)
+    store("openai", "chat.completions", params, "".join(parts))
+
+
+async def openai_stream_async(prompt):
+    # Yield the cached response content in one piece if available
+    messages = build_messages(prompt)
+    params = {"model": MODEL, "messages": messages}
+    content = await asyncio.to_thread(lookup, "openai", "chat.completions", params)
+    if content is not None:
+        yield content
+        return
+    
+    # Otherwise yield the content as it is generated, opening the stream within the rate limit
+    stream = await call_async("openai", lambda: create_completion_async(MODEL, messages, stream=True))
+    parts = []
+    chunks = stream.__aiter__()
+    elapsed = 0.0
+    while True:
+        # Time only the wait for the next chunk of the body, not the consumer's work between pieces
+        start = time.perf_counter()
+        try:
+            chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            break
+        except Exception:
+            record_call("openai_stream", elapsed + time.perf_counter() - start, succeeded=False)
+            raise
+        finally:
+            elapsed += time.perf_counter() - start
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            yield parts[-1]
+    
+    # Record the time spent reading the body and store the complete response under the same key as a non-streamed request
+    record_stream(elapsed, parts)
+    await asyncio.to_thread(store, "openai", "chat.completions", params, "".join(parts))
+
+
+def record_stream(elapsed, parts):
+    # Record the time spent reading the body and the content received
+    record_call("openai_stream", elapsed)
+    count("bytes_downloaded", sum(len(part.encode('utf-8')) for part in parts), client="openai")
+
+
+def build_messages(prompt):
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def get_client():
+    global _client
+    with _lock:
+        if _client is None:
+            # Create an OpenAI client with the provided API key, leaving retries to the rate limiter
+            import openai
+            _client = openai.OpenAI(api_key=OPENAI_API_KEY, max_retries=0, timeout=openai.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT))
+        return _client
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        # Create an asynchronous OpenAI client over the shared asynchronous transport, leaving retries to the rate limiter
+        import openai
+        _async_clients[loop] = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0, timeout=openai.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                                                  http_client=transport.get_async_client())
+    return _async_clients[loop]
+
+
+def create_completion(model, messages, **options):
+    # Send the messages to the chat completion endpoint of the model
+    with translate_errors():
+        raw_response = get_client().chat.completions.with_raw_response.create(
+            model=model,
+            messages=messages,
+            **options
+        )
+    return parse_completion(raw_response, options)
+
+
+async def create_completion_async(model, messages, **options):
+    # Await the response of the chat completion endpoint of the model
+    with translate_errors():
+        raw_response = await get_async_client().chat.completions.with_raw_response.create(
+            model=model,
+            messages=messages,
+            **options
+        )
+    return parse_completion(raw_response, options)
+
+
+@contextmanager
+def translate_errors():
+    import openai
+    try:
+        yield
+    except openai.RateLimitError as e:
+        # Distinguish an exhausted account quota from a temporary rate limit
+        if e.code == "insufficient_quota":
+            raise QuotaExceeded("openai") from e
+        raise TransientError(str(e)) from e
+    except (openai.APIConnectionError, openai.InternalServerError) as e:
+        raise TransientError(str(e)) from e
+
+
+def parse_completion(raw_response, options):
+    # Track the remaining requests reported by OpenAI
+    remaining = raw_response.headers.get("x-ratelimit-remaining-requests")
+    if remaining is not None:
+        get_limiter("openai").update(int(remaining))
+    response = raw_response.parse()
+    
+    # Return the stream of chunks as is if streaming was requested
+    if options.get("stream"):
+        return response
+    count("bytes_downloaded", len(raw_response.http_response.content), client="openai")
     
     # Extract the content of the response message
     response_content = response.choices[0].message.content
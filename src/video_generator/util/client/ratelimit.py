@@ -0,0 +1,187 @@
+# ratelimit.py
+
+import time
+import random
+import asyncio
+import threading
+import requests
+from video_generator.util.instrumentation import record_call
+from config import UNSPLASH_REQUESTS_PER_HOUR
+
+# Request rate per second, burst capacity and quota reset period in seconds of each API
+RATE_LIMITS = {
+    "unsplash": (UNSPLASH_REQUESTS_PER_HOUR / 3600, UNSPLASH_REQUESTS_PER_HOUR, 3600),
+    "unsplash_images": (20, 20, None),
+    "openai": (1, 20, None),
+    "google": (5, 20, None),
+    "youtube": (5, 10, None),
+}
+
+# Shared rate limiters, created on first use
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+class QuotaExceeded(Exception):
+    # The API quota is used up until it resets, so retrying earlier is pointless
+    def __init__(self, api, reset_at=None):
+        super().__init__(f"{api} quota exceeded")
+        self.api = api
+        self.reset_at = reset_at
+
+
+class TransientError(Exception):
+    # A temporary failure such as a network error or an overloaded server
+    pass
+
+
+class Cancelled(Exception):
+    # The caller stopped waiting for the rate limit before the request could be sent
+    pass
+
+
+def call(api, function, retries=5, backoff=1, stop=None):
+    # Call the API function within the rate limit of the API, giving up once the stop event is set
+    return get_limiter(api).call(function, retries, backoff, stop)
+
+
+async def call_async(api, function, retries=5, backoff=1):
+    # Await the coroutine returned by the API function within the rate limit of the API, without blocking the event loop
+    return await get_limiter(api).call_async(function, retries, backoff)
+
+
+def get_limiter(api):
+    with _limiters_lock:
+        if api not in _limiters:
+            _limiters[api] = RateLimiter(api, *RATE_LIMITS[api])
+        return _limiters[api]
+
+
+def raise_for_status(response, api):
+    # Distinguish exhausted quotas and temporary failures from other HTTP errors, reading the body only for a 403
+    if response.status_code == 403:
+        text = response.text.lower()
+        if "rate limit exceeded" in text or "quota" in text:
+            raise QuotaExceeded(api)
+    if response.status_code == 429 or response.status_code >= 500:
+        # Responses of requests name the status reason and those of httpx its reason phrase
+        reason = getattr(response, "reason", None) or getattr(response, "reason_phrase", "")
+        raise TransientError(f"{api} returned {response.status_code} {reason}")
+    response.raise_for_status()
+
+
+class RateLimiter:
+    # Token bucket refilled at a fixed rate and corrected by the remaining quota reported by the API
+    def __init__(self, name, rate, capacity, reset_period=None):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.reset_period = reset_period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+    
+    def acquire(self, stop=None):
+        while True:
+            wait = self.reserve()
+            if wait <= 0:
+                return
+            sleep(wait, stop)
+    
+    async def acquire_async(self):
+        while True:
+            wait = self.reserve()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+    
+    def reserve(self):
+        # Take a token and return 0, or return how long to wait before trying again
+        with self.lock:
+            # Refill the bucket for the time elapsed since the last request
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            
+            # Take a token unless the quota is exhausted or the bucket is empty
+            wait = self.blocked_until - time.time()
+            if wait <= 0 and self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            if wait <= 0:
+                wait = (1 - self.tokens) / self.rate
+            return wait
+    
+    def update(self, remaining):
+        # Trust the remaining quota reported by the API over the local estimate
+        with self.lock:
+            self.tokens = min(self.capacity, remaining)
+            if remaining <= 0:
+                self.blocked_until = max(self.blocked_until, self.next_reset())
+    
+    def exhaust(self, reset_at=None):
+        # Block all requests until the quota resets
+        with self.lock:
+            self.tokens = 0
+            self.blocked_until = max(self.blocked_until, reset_at or self.next_reset())
+    
+    def next_reset(self):
+        # Quotas with a reset period reset at the start of the next period
+        now = time.time()
+        if self.reset_period:
+            return now - now % self.reset_period + self.reset_period + 5
+        return now + 60
+    
+    def call(self, function, retries=5, backoff=1, stop=None):
+        attempt = 0
+        while True:
+            self.acquire(stop)
+            start = time.perf_counter()
+            try:
+                result = function()
+                record_call(self.name, time.perf_counter() - start)
+                return result
+            except (QuotaExceeded, TransientError, requests.ConnectionError, requests.Timeout) as e:
+                attempt, delay = self.failed(e, start, attempt, retries, backoff)
+                sleep(delay, stop)
+    
+    async def call_async(self, function, retries=5, backoff=1):
+        import httpx
+        attempt = 0
+        while True:
+            await self.acquire_async()
+            start = time.perf_counter()
+            try:
+                result = await function()
+                record_call(self.name, time.perf_counter() - start)
+                return result
+            except (QuotaExceeded, TransientError, httpx.TransportError) as e:
+                attempt, delay = self.failed(e, start, attempt, retries, backoff)
+                await asyncio.sleep(delay)
+    
+    def failed(self, error, start, attempt, retries, backoff):
+        # Record the failed call and return the attempt count and the delay before the next attempt, raising the error if it should not be retried
+        record_call(self.name, time.perf_counter() - start, succeeded=False)
+        if isinstance(error, QuotaExceeded):
+            # Give up on quotas that do not reset within the run, otherwise wait for the reset
+            if error.reset_at is None and self.reset_period is None:
+                raise error
+            self.exhaust(error.reset_at)
+            print(f"No {self.name} requests remaining, waiting until {time.strftime('%H:%M:%S', time.localtime(self.blocked_until))}")
+            return attempt, 0
+        attempt += 1
+        if attempt > retries:
+            raise error
+        
+        # Retry temporary failures with jittered exponential backoff
+        delay = backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+        print(f"{self.name} request failed, retrying in {delay:.1f} seconds: {error}")
+        return attempt, delay
+
+
+def sleep(seconds, stop=None):
+    # Wait for the given time, waking up early and raising if the stop event is set
+    if stop is None:
+        time.sleep(seconds)
+    elif stop.wait(seconds):
+        raise Cancelled()
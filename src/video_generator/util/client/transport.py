@@ -0,0 +1,135 @@
+# transport.py
+
+import weakref
+import asyncio
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_RETRIES, HTTP_POOL_SIZE, HTTP_ASYNC_CONNECTIONS, CAPTION_CONCURRENCY, TTS_CONCURRENCY
+
+# Keep-alive connections kept open per host, sized by how many requests each host receives concurrently
+POOL_SIZES = {
+    "api.unsplash.com": 4,
+    "images.unsplash.com": 16,
+    "i.ytimg.com": 2,
+    "translation.googleapis.com": CAPTION_CONCURRENCY,
+    "texttospeech.googleapis.com": TTS_CONCURRENCY,
+}
+
+# Size in bytes of the chunks read from a streamed response
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Shared session, created on first use
+_session = None
+_lock = threading.Lock()
+
+# Asynchronous clients, one per event loop since their connections are bound to the loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            # Retry only failures to connect, leaving HTTP errors to the rate limiter of each API
+            retry = Retry(total=HTTP_RETRIES, connect=HTTP_RETRIES, read=0, status=0, backoff_factor=0.5)
+            
+            # Pool the connections of every host so requests reuse their TCP and TLS sessions
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE, max_retries=retry))
+            for host, size in POOL_SIZES.items():
+                session.mount(f"https://{host}/", HTTPAdapter(pool_connections=1, pool_maxsize=size, max_retries=retry))
+            _session = session
+        return _session
+
+
+def request(method, url, timeout=None, **kwargs):
+    # Send a request over the shared session, always bounded by a timeout
+    return get_session().request(method, url, timeout=timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def download(url, file=None, chunk_size=DOWNLOAD_CHUNK_SIZE, check=None, **kwargs):
+    # Stream the response body instead of buffering it inside the response
+    with get(url, stream=True, **kwargs) as response:
+        # Let the caller check the status before the body is read
+        if check is not None:
+            check(response)
+        else:
+            response.raise_for_status()
+        
+        # Write the chunks to the file if given, otherwise collect them into a single buffer
+        content = bytearray()
+        for chunk in response.iter_content(chunk_size):
+            if file is not None:
+                file.write(chunk)
+            else:
+                content.extend(chunk)
+    
+    # Return the buffer itself rather than a copy of it
+    return content if file is None else None
+
+
+def get_async_client():
+    import httpx
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        # Retry only failures to connect, and bound the connections open at once rather than the requests in flight
+        limits = httpx.Limits(max_connections=HTTP_ASYNC_CONNECTIONS, max_keepalive_connections=HTTP_POOL_SIZE)
+        _async_clients[loop] = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(retries=HTTP_RETRIES, limits=limits),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        )
+    return _async_clients[loop]
+
+
+async def close_async_client():
+    # Close the connections of the client of the running event loop
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def request_async(method, url, timeout=None, **kwargs):
+    # Send a request without blocking the event loop, bounded by the client timeout unless another is given
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    return await get_async_client().request(method, url, **kwargs)
+
+
+async def get_async(url, **kwargs):
+    return await request_async("GET", url, **kwargs)
+
+
+async def post_async(url, **kwargs):
+    return await request_async("POST", url, **kwargs)
+
+
+async def download_async(url, file=None, chunk_size=DOWNLOAD_CHUNK_SIZE, check=None, **kwargs):
+    # Stream the response body without blocking the event loop
+    async with get_async_client().stream("GET", url, **kwargs) as response:
+        # Read the body of an error response so the check can inspect it
+        if response.is_error:
+            await response.aread()
+        
+        # Let the caller check the status before the body is read
+        if check is not None:
+            check(response)
+        else:
+            response.raise_for_status()
+        
+        # Write the chunks to the file if given, otherwise collect them into a single buffer
+        content = bytearray()
+        async for chunk in response.aiter_bytes(chunk_size):
+            if file is not None:
+                file.write(chunk)
+            else:
+                content.extend(chunk)
+    return content if file is None else None
@@ -1,25 +1,133 @@
 # unsplash.py
 
 import io
-import requests
 from PIL import Image
 from config import UNSPLASH_API_KEY
+from video_generator.util.client import transport
+from video_generator.util.client.cache import cached, cached_async
+from video_generator.util.client.ratelimit import call, call_async, get_limiter, raise_for_status
+from video_generator.util.instrumentation import count
 
-def query_image(animal, width, height):
-    # Construct the URL for querying a random image with the specified parameters
-    url = f'https://api.unsplash.com/photos/random?query={animal}&client_id={UNSPLASH_API_KEY}&w={width}&h={height}&orientation=landscape'
+def query_image(animal, width, height, stop=None):
+    # Send a GET request to the Unsplash API within the remaining quota
+    data = call("unsplash", lambda: request_random_image(query_url(animal, width, height)), stop=stop)
     
+    # Return a lightweight candidate carrying the image metadata
+    return ImageCandidate(data)
+
+
+async def query_image_async(animal, width, height):
+    # Await a GET request to the Unsplash API within the remaining quota
+    data = await call_async("unsplash", lambda: request_random_image_async(query_url(animal, width, height)))
+    
+    # Return a lightweight candidate carrying the image metadata
+    return ImageCandidate(data)
+
+
+def query_url(animal, width, height):
+    # Construct the URL for querying a random image with the specified parameters
+    return f'https://api.unsplash.com/photos/random?query={animal}&client_id={UNSPLASH_API_KEY}&w={width}&h={height}&orientation=landscape'
+
+
+def request_random_image(url):
     # Send a GET request to the Unsplash API
-    response = requests.get(url)
+    return parse_random_image(transport.get(url))
+
+
+async def request_random_image_async(url):
+    # Await a GET request to the Unsplash API
+    return parse_random_image(await transport.get_async(url))
+
+
+def parse_random_image(response):
+    # Track the remaining hourly quota reported by Unsplash
+    remaining = response.headers.get("X-Ratelimit-Remaining")
+    if remaining is not None:
+        get_limiter("unsplash").update(int(remaining))
+    
+    # Raise an exception for HTTP errors
+    raise_for_status(response, "unsplash")
+    count("bytes_downloaded", len(response.content), client="unsplash")
     
     # Parse the JSON response
-    data = response.json()
+    return response.json()
+
+
+def download_image(url, stop=None):
+    # Download the image content, reusing a cached copy of the same URL if available
+    content = cached("unsplash", "download", {"url": url}, lambda: call("unsplash_images", lambda: request_content(url), stop=stop), binary=True)
     
-    # Extract the URL of the full-size image from the response data
-    image_url = data["urls"]["full"]
+    # Open the image content and convert it to a PIL Image object
+    return Image.open(io.BytesIO(content))
+
+
+async def download_image_async(url):
+    # Await the image content, reusing a cached copy of the same URL if available
+    content = await cached_async("unsplash", "download", {"url": url}, lambda: call_async("unsplash_images", lambda: request_content_async(url)), binary=True)
+    
+    # Open the image content and convert it to a PIL Image object
+    return Image.open(io.BytesIO(content))
+
+
+def request_content(url):
+    # Stream the image into a buffer, raising an exception for HTTP errors before reading it
+    buffer = io.BytesIO()
+    transport.download(url, buffer, check=lambda response: raise_for_status(response, "unsplash_images"))
+    return buffered_content(buffer)
+
+
+async def request_content_async(url):
+    # Stream the image into a buffer without blocking the event loop, raising an exception for HTTP errors before reading it
+    buffer = io.BytesIO()
+    await transport.download_async(url, buffer, check=lambda response: raise_for_status(response, "unsplash_images"))
+    return buffered_content(buffer)
+
+
+def buffered_content(buffer):
+    # Take the bytes out of the buffer, which shrinks it in place rather than copying it
+    content = buffer.getvalue()
+    count("bytes_downloaded", len(content), client="unsplash_images")
+    return content
+
+
+class ImageCandidate:
+    # Unsplash photo metadata, downloaded only when a rendition is needed
+    def __init__(self, data):
+        self.id = data["id"]
+        self.width = data["width"]
+        self.height = data["height"]
+        self.urls = data["urls"]
+    
+    @property
+    def size(self):
+        # Original dimensions of the photo, known without downloading it
+        return (self.width, self.height)
+    
+    def preview(self, rendition="small", stop=None):
+        # Download a small rendition of the photo for classification
+        return download_image(self.urls[rendition], stop)
     
-    # Open the image from its URL and convert it to a PIL Image object
-    image = Image.open(io.BytesIO(requests.get(image_url).content))
+    async def preview_async(self, rendition="small"):
+        # Await a small rendition of the photo for classification
+        return await download_image_async(self.urls[rendition])
     
-    # Return the PIL Image object
+    def fetch(self, width, height):
+        # Let Unsplash resize and crop the original to the requested dimensions
+        return fit(download_image(self.rendition_url(width, height)), width, height)
+    
+    async def fetch_async(self, width, height):
+        # Await the original resized and cropped by Unsplash to the requested dimensions
+        return fit(await download_image_async(self.rendition_url(width, height)), width, height)
+    
+    def rendition_url(self, width, height):
+        # Ask Unsplash to resize and crop the original to the requested dimensions
+        url = self.urls["raw"]
+        separator = '&' if '?' in url else '?'
+        return f"{url}{separator}w={width}&h={height}&fit=crop&fm=jpg&q=85"
+
+
+def fit(image, width, height):
+    # Ensure the exact output size in case the rendition differs slightly
+    if image.size != (width, height):
+        image = image.resize((width, height))
     return image
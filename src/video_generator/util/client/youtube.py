@@ -1,31 +1,47 @@
 # youtube.py
 
 import io
-import tempfile
-from googleapiclient.http import MediaIoBaseUpload, MediaFileUpload
+import os
+import time
+import random
+import itertools
+import threading
+import httplib2
 from auth.authorization import get_authenticated_service
+from video_generator.util.client.ratelimit import call, QuotaExceeded, TransientError
+from video_generator.util.instrumentation import timed, count, record_call
+from config import UPLOAD_CHUNK_SIZE
 
-# Authenticate with the YouTube API
-youtube = get_authenticated_service()
+# HTTP status codes after which an interrupted upload is resumed
+RETRIABLE_STATUS_CODES = [500, 502, 503, 504]
 
-def upload_video(animal, title, description, video):
-    # Create a temporary MP4 video file
-    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as temp_file:
-        video_file_path = temp_file.name
-        video.write_videofile(video_file_path, fps=24)
+# Tags added to every video, and the maximum total length of the tags accepted by YouTube
+DEFAULT_TAGS = ["animals", "safari", "expedition", "wildlife", "nature", "yt:cc=on"]
+MAX_TAGS_LENGTH = 500
+
+# Per-thread YouTube API services, since the underlying HTTP client is not thread-safe
+_local = threading.local()
+
+def get_youtube():
+    # Authenticate with the YouTube API on first use in this thread
+    if not hasattr(_local, "youtube"):
+        _local.youtube = get_authenticated_service()
+    return _local.youtube
+
+
+@timed("upload")
+def upload_video(animal, title, description, video_file_path, tags=None, chunksize=UPLOAD_CHUNK_SIZE, retries=5):
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import MediaFileUpload
     
     # Construct the request to upload the video
-    request = youtube.videos().insert(
+    request = get_youtube().videos().insert(
         part="snippet,status",
         body={
             "snippet": {
                 "title": title,
                 "description": description,
-                "tags": [
-                    animal, "animals",
-                    "safari", "expedition",
-                    "wildlife", "nature",
-                    "yt:cc=on"],
+                "tags": build_tags(animal, tags),
                 "categoryId": 15
             },
             "status": {
@@ -33,29 +49,100 @@ def upload_video(animal, title, description, video):
                 "madeForKids": False
             }
         },
-        media_body=MediaFileUpload(video_file_path, chunksize=-1, resumable=True)
+        media_body=MediaFileUpload(video_file_path, chunksize=chunksize, resumable=True)
     )
     
-    # Execute the request to upload the video
-    request.execute()
-    
-    # Extract the video ID from the response
-    _, response = request.next_chunk()
+    # Upload the video in chunks until the response with the video ID is received
+    response = None
+    failures = 0
+    start = time.time()
+    while response is None:
+        chunk_start = time.perf_counter()
+        try:
+            status, response = request.next_chunk()
+            record_call("youtube_upload", time.perf_counter() - chunk_start)
+            failures = 0
+            if status:
+                # Report the upload progress and throughput
+                elapsed = max(time.time() - start, 1e-6)
+                print(f"Uploaded {status.progress():.0%} ({status.resumable_progress / elapsed / 1e6:.1f} MB/s)")
+        except HttpError as e:
+            record_call("youtube_upload", time.perf_counter() - chunk_start, succeeded=False)
+            if e.resp.status not in RETRIABLE_STATUS_CODES:
+                raise
+            failures = retry_upload(failures, retries, e)
+        except (httplib2.HttpLib2Error, OSError) as e:
+            record_call("youtube_upload", time.perf_counter() - chunk_start, succeeded=False)
+            failures = retry_upload(failures, retries, e)
     video_id = response['id']
+    count("bytes_uploaded", os.path.getsize(video_file_path), client="youtube")
     
-    # Print a success message with the uploaded video ID
-    print(f"Video id '{video_id}' was successfully uploaded.")
+    # Print a success message with the uploaded video ID and throughput
+    elapsed = max(time.time() - start, 1e-6)
+    print(f"Video id '{video_id}' was successfully uploaded ({os.path.getsize(video_file_path) / elapsed / 1e6:.1f} MB/s).")
     
     # Return the uploaded video ID
     return video_id
 
 
-def insert_captions(video_id, script, language):
+def build_tags(animal, tags=None):
+    # Combine the animal, the generated tags and the default tags without duplicates
+    result = []
+    length = 0
+    for tag in [animal] + (tags or []) + DEFAULT_TAGS:
+        if tag.lower() in (existing.lower() for existing in result):
+            continue
+        
+        # Skip tags that would exceed the total length limit, counting the quotes around tags with spaces
+        tag_length = len(tag) + (2 if " " in tag else 0) + (1 if result else 0)
+        if length + tag_length > MAX_TAGS_LENGTH:
+            continue
+        result.append(tag)
+        length += tag_length
+    return result
+
+
+def execute(request):
+    # Execute the request within the rate limit of the YouTube API
+    return call("youtube", lambda: execute_request(request))
+
+
+def execute_request(request):
+    from googleapiclient.errors import HttpError
+    try:
+        return request.execute()
+    except HttpError as e:
+        # Distinguish an exhausted daily quota from temporary failures
+        if e.resp.status == 403 and b"quotaExceeded" in e.content:
+            raise QuotaExceeded("youtube") from e
+        if e.resp.status == 429 or e.resp.status in RETRIABLE_STATUS_CODES:
+            raise TransientError(str(e)) from e
+        raise
+    except (httplib2.HttpLib2Error, OSError) as e:
+        raise TransientError(str(e)) from e
+
+
+def retry_upload(failures, retries, error):
+    # Give up once the maximum number of consecutive failures is reached
+    failures += 1
+    if failures > retries:
+        raise error
+    
+    # Wait with exponential backoff and jitter before resuming from the last uploaded chunk
+    delay = 2 ** failures + random.uniform(0, 1)
+    print(f"Upload interrupted, resuming in {delay:.1f} seconds: {error}")
+    time.sleep(delay)
+    return failures
+
+
+def insert_captions(video_id, script, language, retried=False):
+    from googleapiclient.http import MediaIoBaseUpload
+    
     # Extract the language code from the provided language string
     language = language.split('-')[0].strip()
     
     # Construct the request to insert captions
-    request = youtube.captions().insert(
+    request = get_youtube().captions().insert(
         part="snippet",
         body={
             "snippet": {
@@ -67,24 +154,40 @@ def insert_captions(video_id, script, language):
         media_body=MediaIoBaseUpload(io.BytesIO(script.encode('utf-8')), mimetype='text/plain')
     )
     
-    # Execute the request to insert captions
-    request.execute()
+    # Look for the track before every retry, since YouTube may have stored it before a failed attempt timed out
+    attempts = itertools.count(int(retried))
+    def insert():
+        if next(attempts) and has_captions(video_id, language):
+            print(f"Captions for {language} were already published, skipping insert")
+            return
+        execute_request(request)
+    
+    # Execute the request to insert captions within the rate limit of the YouTube API
+    call("youtube", insert)
     print("Succeeded to publish subtitles!")
 
 
+def has_captions(video_id, language):
+    # List the caption tracks of the video and look for the one inserted for the language
+    response = execute_request(get_youtube().captions().list(part="snippet", videoId=video_id))
+    return any(item["snippet"]["language"] == language and item["snippet"]["name"] == "Subtitle" for item in response.get("items", []))
+
+
 def set_thumbnail(video_id, thumbnail):
+    from googleapiclient.http import MediaIoBaseUpload
+    
     # Convert the thumbnail image to bytes
     image_bytes = io.BytesIO()
     thumbnail.save(image_bytes, format='JPEG')
     
     # Construct the request to set the thumbnail
-    request = youtube.thumbnails().set(
+    request = get_youtube().thumbnails().set(
         videoId=video_id,
         media_body=MediaIoBaseUpload(image_bytes, mimetype='image/jpeg')
     )
     
     # Execute the request to set the thumbnail
-    request.execute()
+    execute(request)
     
     # Print a success message
     print("Successfully published thumbnail!")
@@ -92,13 +195,13 @@ def set_thumbnail(video_id, thumbnail):
 
 def list_video_snippet(video_id):
     # Construct the request to list video snippet information
-    request = youtube.videos().list(
+    request = get_youtube().videos().list(
         part="snippet",
         id=video_id
     )
     
     # Execute the request to list video snippet information
-    response = request.execute()
+    response = execute(request)
     
     # Extract and return the snippet information
     snippet = response['items'][0]['snippet']
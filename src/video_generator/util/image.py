@@ -0,0 +1,17 @@
+# image.py
+
+from PIL import Image
+
+def open_image(image):
+    # Open an image spooled to disk, or return an image already held in memory
+    if isinstance(image, str):
+        return Image.open(image).convert('RGB')
+    return image
+
+
+def image_size(image):
+    # Read the size of a spooled image from its header without decoding its pixels
+    if isinstance(image, str):
+        with Image.open(image) as file:
+            return file.size
+    return image.size
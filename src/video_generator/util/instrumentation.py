@@ -0,0 +1,187 @@
+# instrumentation.py
+
+import os
+import sys
+import json
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from config import INSTRUMENTATION
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Whether measurements are recorded, checked on every call so it can be enabled at runtime
+_enabled = INSTRUMENTATION
+
+# Recorded spans, counters and API call statistics
+_spans = []
+_counters = {}
+_calls = {}
+_lock = threading.Lock()
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def is_enabled():
+    return _enabled
+
+
+def timed(name):
+    # Decorator measuring every call of a function as a span
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _measure(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def _measure(name):
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+    start_children = children_cpu_time()
+    status = "succeeded"
+    try:
+        yield
+    except BaseException:
+        status = "failed"
+        raise
+    finally:
+        # Record the wall time, the CPU time of the thread and that of the subprocesses such as ffmpeg that finished meanwhile.
+        # Work handed to pool threads is not included, so the CPU of such stages is that of their own thread and of the nested spans
+        record = {
+            "name": name,
+            "thread": threading.current_thread().name,
+            "status": status,
+            "start": time.time() - (time.perf_counter() - start_wall),
+            "wall_seconds": time.perf_counter() - start_wall,
+            "cpu_seconds": time.thread_time() - start_cpu,
+            "children_cpu_seconds": children_cpu_time() - start_children
+        }
+        with _lock:
+            _spans.append(record)
+
+
+def count(name, value=1, **labels):
+    # Increment a counter such as bytes downloaded or images rejected by reason
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def record_call(client, seconds, succeeded=True):
+    # Track the number of calls and the latency of each API client
+    if not _enabled:
+        return
+    with _lock:
+        stats = _calls.setdefault(client, {"count": 0, "failures": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        stats["count"] += 1
+        stats["failures"] += 0 if succeeded else 1
+        stats["total_seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+
+def children_cpu_time():
+    # CPU time of the subprocesses that have been waited for
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def peak_rss():
+    # Peak resident memory of the whole process in bytes, if available on this platform
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def report():
+    # Build the structured run report
+    with _lock:
+        return {
+            "spans": list(_spans),
+            "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in _counters.items()],
+            "calls": {client: dict(stats) for client, stats in _calls.items()},
+            "process_peak_rss_bytes": peak_rss()
+        }
+
+
+def write_report(path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report(), file, indent=2)
+    print(f"Successfully wrote run report: {path}")
+
+
+def aggregate_stages(spans):
+    # Sum the runs, wall time and CPU time of the spans of each stage
+    stages = {}
+    for record in spans:
+        stage = stages.setdefault(record["name"], {"count": 0, "wall": 0.0, "cpu": 0.0, "children_cpu": 0.0})
+        stage["count"] += 1
+        stage["wall"] += record["wall_seconds"]
+        stage["cpu"] += record["cpu_seconds"]
+        stage["children_cpu"] += record["children_cpu_seconds"]
+    return stages
+
+
+def prometheus_text():
+    # Format the measurements in the Prometheus text exposition format
+    data = report()
+    lines = []
+    
+    # Aggregate the spans per stage
+    stages = aggregate_stages(data["spans"])
+    lines.append("# TYPE video_generator_stage_wall_seconds_total counter")
+    lines += [f'video_generator_stage_wall_seconds_total{{stage="{name}"}} {stage["wall"]:.6f}' for name, stage in stages.items()]
+    lines.append("# TYPE video_generator_stage_cpu_seconds_total counter")
+    lines += [f'video_generator_stage_cpu_seconds_total{{stage="{name}"}} {stage["cpu"]:.6f}' for name, stage in stages.items()]
+    lines.append("# TYPE video_generator_stage_children_cpu_seconds_total counter")
+    lines += [f'video_generator_stage_children_cpu_seconds_total{{stage="{name}"}} {stage["children_cpu"]:.6f}' for name, stage in stages.items()]
+    lines.append("# TYPE video_generator_stage_runs_total counter")
+    lines += [f'video_generator_stage_runs_total{{stage="{name}"}} {stage["count"]}' for name, stage in stages.items()]
+    
+    # Export the API call statistics per client
+    lines.append("# TYPE video_generator_api_calls_total counter")
+    lines += [f'video_generator_api_calls_total{{client="{client}"}} {stats["count"]}' for client, stats in data["calls"].items()]
+    lines.append("# TYPE video_generator_api_failures_total counter")
+    lines += [f'video_generator_api_failures_total{{client="{client}"}} {stats["failures"]}' for client, stats in data["calls"].items()]
+    lines.append("# TYPE video_generator_api_latency_seconds_total counter")
+    lines += [f'video_generator_api_latency_seconds_total{{client="{client}"}} {stats["total_seconds"]:.6f}' for client, stats in data["calls"].items()]
+    
+    # Export the counters with their labels
+    for counter in data["counters"]:
+        labels = ",".join(f'{key}="{value}"' for key, value in counter["labels"].items())
+        lines.append(f'video_generator_{counter["name"]}_total{{{labels}}} {counter["value"]}')
+    
+    # Export the peak memory of the process
+    if data["process_peak_rss_bytes"] is not None:
+        lines.append("# TYPE video_generator_process_peak_rss_bytes gauge")
+        lines.append(f'video_generator_process_peak_rss_bytes {data["process_peak_rss_bytes"]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(prometheus_text())
+
+
+def print_summary():
+    # Print the time spent in each stage and the peak memory of the process
+    data = report()
+    stages = aggregate_stages(data["spans"])
+    for name, stage in sorted(stages.items(), key=lambda item: -item[1]["wall"]):
+        print(f"{name}: {stage['wall']:.3f}s wall, {stage['cpu']:.3f}s cpu, {stage['children_cpu']:.3f}s subprocess cpu over {stage['count']} runs")
+    if data["process_peak_rss_bytes"] is not None:
+        print(f"Peak memory of the process: {data['process_peak_rss_bytes'] / 2 ** 20:.1f} MB")
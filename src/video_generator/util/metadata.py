@@ -1,41 +1,26 @@
 # metadata.py
 
+import json
 from video_generator.util.client.openai import openai_response
+from video_generator.util.prompts import load_prompt
+from video_generator.util.instrumentation import timed
 
-def get_title(animal):
-    # Define the file path for the title prompt text file
-    file_path = "video_generator/assets/prompts/title_prompt.txt"
-    
-    # Read the content of the title prompt text file
-    with open(file_path, 'r', encoding='utf-8') as file:
-        prompt = file.read()
-    
-    # Replace the placeholder 'ANIMAL_NAME' with the provided animal
-    prompt = prompt.replace('ANIMAL_NAME', animal)
-    
-    # Generate the title using OpenAI's API based on the modified prompt
-    title = openai_response(prompt)
-    
-    # Return the generated title
-    print("Successfully generated title!")
-    return title
-
-
-def get_description(animal, title):
-    # Define the file path for the description prompt text file
-    file_path = "video_generator/assets/prompts/description_prompt.txt"
-    
-    # Read the content of the description prompt text file
-    with open(file_path, 'r', encoding='utf-8') as file:
-        prompt = file.read()
-    
-    # Replace the placeholders 'ANIMAL_NAME' and 'TITLE' with the provided animal and title, respectively
-    prompt = prompt.replace('ANIMAL_NAME', animal)
-    prompt = prompt.replace('TITLE', title)
-    
-    # Generate the description using OpenAI's API based on the modified prompt
-    description = openai_response(prompt)
-    
-    # Return the generated description
-    print("Successfully generated description!")
-    return description
+@timed("metadata")
+def get_metadata(animal):
+    # Fill the animal into the compiled metadata prompt
+    prompt = load_prompt("metadata").render(ANIMAL_NAME=animal)
+    
+    # Generate the title, description and tags in a single JSON mode request
+    metadata = json.loads(openai_response(prompt, json_mode=True))
+    
+    # Keep only the expected fields, tolerating a missing or malformed tag list
+    tags = metadata.get("tags")
+    metadata = {
+        "title": metadata["title"].strip(),
+        "description": metadata["description"].strip(),
+        "tags": [str(tag).strip() for tag in tags if str(tag).strip()] if isinstance(tags, list) else []
+    }
+    
+    # Return the generated metadata
+    print("Successfully generated metadata!")
+    return metadata
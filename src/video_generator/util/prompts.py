@@ -0,0 +1,26 @@
+# prompts.py
+
+import re
+from functools import lru_cache
+
+# Directory containing the prompt templates
+PROMPTS_DIR = "video_generator/assets/prompts"
+
+# Placeholders substituted into the prompt templates
+PLACEHOLDERS = ["ANIMAL_NAME", "WORD_COUNT"]
+
+@lru_cache(maxsize=None)
+def load_prompt(name):
+    # Read and compile the prompt template once per process
+    with open(f"{PROMPTS_DIR}/{name}_prompt.txt", 'r', encoding='utf-8') as file:
+        return PromptTemplate(file.read())
+
+
+class PromptTemplate:
+    # Prompt split once into literal text and placeholders, so rendering is a single join
+    def __init__(self, text, placeholders=PLACEHOLDERS):
+        self.parts = re.split(f"({'|'.join(map(re.escape, placeholders))})", text)
+    
+    def render(self, **values):
+        # Placeholders sit at the odd positions of the split template
+        return "".join(str(values[part]) if index % 2 else part for index, part in enumerate(self.parts))
@@ -0,0 +1,205 @@
+# renderer.py
+
+import os
+import re
+import json
+import hashlib
+import tempfile
+import threading
+import subprocess
+from video_generator.util.image import image_size
+from config import FFMPEG_BINARY, RENDER_THREADS, CACHE_DIR
+
+# Encoder settings shared by the cached intro and the slideshow, so their streams can be joined without re-encoding
+VIDEO_CODEC = ["-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-video_track_timescale", "90000"]
+AUDIO_CODEC = ["-c:a", "aac", "-b:a", "192k", "-ar", "44100", "-ac", "2"]
+AUDIO_FORMAT = "aformat=sample_fmts=fltp:sample_rates=44100:channel_layouts=stereo"
+
+# Directory where the intro is stored pre-rendered per output profile
+INTRO_CACHE_DIR = os.path.join(CACHE_DIR, "intro")
+_intro_lock = threading.Lock()
+
+class FfmpegSlideshow:
+    # Slideshow rendered by a single ffmpeg filtergraph, written with the same call as a MoviePy clip
+    def __init__(self, audio, images, intro_path, fade=1):
+        self.audio = audio
+        self.images = images
+        self.intro_path = intro_path
+        self.fade = fade
+    
+    @property
+    def duration(self):
+        return probe_media(self.intro_path)[0] + self.audio.duration_seconds
+    
+    def write_videofile(self, filename, fps=24, threads=RENDER_THREADS):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Write the images held in memory to disk as still frames for ffmpeg
+            image_paths = []
+            for index, image in enumerate(self.images):
+                if isinstance(image, str):
+                    image_paths.append(image)
+                    continue
+                image_path = os.path.join(temp_dir, f"{index:04d}.jpg")
+                image.save(image_path, quality=95)
+                image_paths.append(image_path)
+            
+            # Get the faded intro pre-rendered with the same encoder settings as the slideshow
+            width, height = image_size(self.images[0])
+            intro_path = prepare_intro(self.intro_path, width, height, fps, self.fade)
+            
+            # Render only the slideshow, piping the raw audio samples through stdin
+            slideshow_path = os.path.join(temp_dir, "slideshow.mp4")
+            run_ffmpeg(self.build_command(slideshow_path, image_paths, fps, threads), self.audio.samples.tobytes())
+            
+            # Join the intro and the slideshow by copying their streams into the output
+            run_ffmpeg(concat_command(filename, [intro_path, slideshow_path], temp_dir))
+        print(f"Successfully rendered video: {filename}")
+    
+    def build_command(self, filename, image_paths, fps, threads):
+        width, height = image_size(self.images[0])
+        duration_per_image = self.audio.duration_seconds / len(image_paths)
+        audio_input = len(image_paths)
+        
+        # Add each still image looped for its duration and the raw audio as inputs
+        command = [FFMPEG_BINARY, "-y"]
+        for image_path in image_paths:
+            command += ["-loop", "1", "-framerate", str(fps), "-t", f"{duration_per_image:.3f}", "-i", image_path]
+        command += ["-f", "f32le", "-ar", str(self.audio.frame_rate), "-ac", str(self.audio.channels), "-i", "pipe:0"]
+        
+        # Fade each image in and out
+        filters = []
+        for index in range(len(image_paths)):
+            filters.append(
+                f"[{index}:v]scale={width}:{height},setsar=1,format=yuv420p,"
+                f"fade=t=in:st=0:d={self.fade},"
+                f"fade=t=out:st={max(duration_per_image - self.fade, 0):.3f}:d={self.fade}[v{index}]"
+            )
+        
+        # Concatenate the images into a single video stream and convert the narration to the output format
+        video_labels = "".join(f"[v{index}]" for index in range(len(image_paths)))
+        filters.append(f"{video_labels}concat=n={len(image_paths)}:v=1:a=0[v]")
+        filters.append(f"[{audio_input}:a]{AUDIO_FORMAT}[a]")
+        
+        # Encode the output with multi-threaded H.264 and AAC
+        return command + [
+            "-filter_complex", ";".join(filters),
+            "-map", "[v]", "-map", "[a]",
+            *VIDEO_CODEC, "-r", str(fps),
+            "-threads", str(threads),
+            *AUDIO_CODEC,
+            filename
+        ]
+
+
+class MoviePySlideshow:
+    # MoviePy slideshow written with the encoder settings of the cached intro and joined to it without re-encoding the intro
+    def __init__(self, video, intro_path, fade=1):
+        self.video = video
+        self.intro_path = intro_path
+        self.fade = fade
+    
+    @property
+    def duration(self):
+        return probe_media(self.intro_path)[0] + self.video.duration
+    
+    def write_videofile(self, filename, fps=24, threads=RENDER_THREADS):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Get the faded intro pre-rendered at the size of the slideshow
+            width, height = self.video.size
+            intro_path = prepare_intro(self.intro_path, width, height, fps, self.fade)
+            
+            # Render only the slideshow with MoviePy, using the same encoder settings as the intro
+            slideshow_path = os.path.join(temp_dir, "slideshow.mp4")
+            self.video.write_videofile(slideshow_path, fps=fps, threads=threads, temp_audiofile=os.path.join(temp_dir, "audio.m4a"), **moviepy_options())
+            
+            # Join the intro and the slideshow by copying their streams into the output
+            run_ffmpeg(concat_command(filename, [intro_path, slideshow_path], temp_dir))
+        print(f"Successfully rendered video: {filename}")
+
+
+def moviepy_options():
+    # Translate the shared encoder settings into the arguments of MoviePy's write_videofile
+    video = dict(zip(VIDEO_CODEC[::2], VIDEO_CODEC[1::2]))
+    audio = dict(zip(AUDIO_CODEC[::2], AUDIO_CODEC[1::2]))
+    return {
+        "codec": video.pop("-c:v"),
+        "preset": video.pop("-preset"),
+        "ffmpeg_params": [value for option in video.items() for value in option],
+        "audio_codec": audio["-c:a"],
+        "audio_bitrate": audio["-b:a"],
+        "audio_fps": int(audio["-ar"])
+    }
+
+
+def prepare_intro(intro_path, width, height, fps, fade=1):
+    # Key the pre-rendered intro by the content of the asset and everything that affects its encoding
+    profile = {"width": width, "height": height, "fps": fps, "fade": fade, "video": VIDEO_CODEC, "audio": AUDIO_CODEC}
+    digest = hashlib.sha256(json.dumps(profile, sort_keys=True).encode('utf-8'))
+    with open(intro_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    path = os.path.join(INTRO_CACHE_DIR, f"{digest.hexdigest()}.mp4")
+    
+    with _intro_lock:
+        if not os.path.exists(path):
+            # Render the intro once for this profile, writing it atomically so a failed render is never reused
+            os.makedirs(INTRO_CACHE_DIR, exist_ok=True)
+            temp_path = f"{path}.part"
+            run_ffmpeg(intro_command(intro_path, temp_path, width, height, fps, fade))
+            os.replace(temp_path, path)
+            print(f"Successfully prepared intro: {path}")
+    return path
+
+
+def intro_command(intro_path, filename, width, height, fps, fade):
+    duration, has_audio = probe_media(intro_path)
+    
+    # Add silence as the audio of an intro without any, so every segment has the same streams
+    command = [FFMPEG_BINARY, "-y", "-i", intro_path]
+    if not has_audio:
+        command += ["-f", "lavfi", "-t", f"{duration:.3f}", "-i", "anullsrc=r=44100:cl=stereo"]
+    
+    # Scale the intro to the output size and fade it out, padding or trimming its audio to the video
+    filters = [
+        f"[0:v]scale={width}:{height},setsar=1,fps={fps},format=yuv420p,"
+        f"fade=t=out:st={max(duration - fade, 0):.3f}:d={fade}[v]",
+        f"[{0 if has_audio else 1}:a]atrim=0:{duration:.3f},apad=whole_dur={duration:.3f},{AUDIO_FORMAT}[a]"
+    ]
+    
+    # Encode the intro with the same settings as the slideshow
+    return command + [
+        "-filter_complex", ";".join(filters),
+        "-map", "[v]", "-map", "[a]",
+        *VIDEO_CODEC, "-r", str(fps),
+        *AUDIO_CODEC,
+        "-f", "mp4",
+        filename
+    ]
+
+
+def concat_command(filename, paths, temp_dir):
+    # List the segments for the concat demuxer, quoting the paths as it requires
+    list_path = os.path.join(temp_dir, "segments.txt")
+    with open(list_path, 'w', encoding='utf-8') as file:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            file.write(f"file '{escaped}'\n")
+    
+    # Copy the streams of the segments into the output without re-encoding
+    return [FFMPEG_BINARY, "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", "-movflags", "+faststart", filename]
+
+
+def run_ffmpeg(command, input=None):
+    # Run ffmpeg and raise an exception if it failed
+    process = subprocess.run(command, input=input, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {process.stderr.decode('utf-8', 'replace')[-2000:]}")
+
+
+def probe_media(path):
+    # Read the duration and the presence of an audio stream from ffmpeg's input summary
+    process = subprocess.run([FFMPEG_BINARY, "-hide_banner", "-i", path], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    output = process.stderr.decode('utf-8', 'replace')
+    hours, minutes, seconds = re.search(r"Duration: (\d+):(\d+):(\d+\.\d+)", output).groups()
+    duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    return duration, re.search(r"Stream #.*Audio:", output) is not None
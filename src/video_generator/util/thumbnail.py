@@ -2,28 +2,36 @@
 
 import io
 import time
-import requests
 import numpy as np
+from functools import lru_cache
 from PIL import Image, ImageFont, ImageDraw, ImageEnhance, ImageFilter
+from video_generator.util.client import transport
 from video_generator.util.client.youtube import set_thumbnail, list_video_snippet
+from video_generator.util.image import open_image
+from video_generator.util.instrumentation import timed, count, record_call
+
+# Paths to the font of the thumbnail text and the logo pasted onto the thumbnail
+FONT_PATH = "video_generator/assets/fonts/font.ttf"
+LOGO_PATH = "video_generator/assets/media/logo.png"
 
 def curate_thumbnail(animal, video_id):
-    # Create the thumbnail
+    # Create the thumbnail from the frame picked by YouTube
     thumbnail = create_thumbnail(animal, video_id)
     
     # Set the curated thumbnail for the video on YouTube
     set_thumbnail(video_id, thumbnail)
 
 
-def create_thumbnail(animal, video_id):
-    # Get the initial thumbnail image
-    thumbnail = get_thumbnail(video_id)
-    
-    # Enhance the contrast of the thumbnail
-    thumbnail = set_contrast(thumbnail)
+@timed("thumbnail")
+def create_thumbnail(animal, video_id=None, images=None):
+    # Get the initial thumbnail image from the best video image if available, otherwise from YouTube
+    if images:
+        thumbnail = select_thumbnail(images)
+    else:
+        thumbnail = get_thumbnail(video_id)
     
-    # Enhance the sharpness of the thumbnail
-    thumbnail = set_sharpness(thumbnail)
+    # Enhance the contrast and sharpness of the thumbnail
+    thumbnail, _ = enhance_thumbnail(thumbnail)
     
     # Add text to the thumbnail
     thumbnail = add_text_to_thumbnail(animal, thumbnail)
@@ -36,9 +44,26 @@ def create_thumbnail(animal, video_id):
     return thumbnail
 
 
-def get_thumbnail(video_id):
+def select_thumbnail(images, sample_width=320):
+    # Score a downsampled copy of each image with the contrast and sharpness metrics
+    scores = []
+    for image in images:
+        sample = open_image(image).copy()
+        sample.thumbnail((sample_width, sample_width))
+        scores.append(measure_contrast(sample) * measure_sharpness(sample))
+    
+    # Return a copy of the best scoring image to draw on
+    best = int(np.argmax(scores))
+    print(f"Selected image {best} as thumbnail")
+    return open_image(images[best]).copy()
+
+
+@timed("thumbnail_poll")
+def get_thumbnail(video_id, initial_delay=15, max_delay=120, backoff=1.5, timeout=3600):
     # Loop until a thumbnail URL is retrieved
     url = None
+    delay = initial_delay
+    deadline = time.time() + timeout
     while url is None:
         # Print a message indicating the attempt to retrieve the thumbnail
         print("Attempting to retrieve thumbnail...")
@@ -54,15 +79,24 @@ def get_thumbnail(video_id):
             # Handle exceptions if no thumbnail is found
             print(f"No thumbnail found, waiting to retry: {e}")
         
-        # Pause execution for 30 seconds before retrying
+        # Wait before retrying, increasing the delay while YouTube is still processing the video
         if url is None:
-            time.sleep(60)
-    
-    # Send a GET request to retrieve the thumbnail image
-    response = requests.get(url)
+            if time.time() + delay > deadline:
+                raise TimeoutError(f"No thumbnail available for video '{video_id}'")
+            time.sleep(delay)
+            delay = min(delay * backoff, max_delay)
     
-    # Create a BytesIO object containing the content of the response
-    thumbnail = io.BytesIO(response.content)
+    # Stream the thumbnail image into a BytesIO object, recording the download like the rate limited API calls
+    thumbnail = io.BytesIO()
+    start = time.perf_counter()
+    try:
+        transport.download(url, thumbnail)
+    except Exception:
+        record_call("youtube_thumbnail", time.perf_counter() - start, succeeded=False)
+        raise
+    record_call("youtube_thumbnail", time.perf_counter() - start)
+    count("bytes_downloaded", thumbnail.tell(), client="youtube_thumbnail")
+    thumbnail.seek(0)
     
     # Open the thumbnail image using PIL's Image module
     thumbnail = Image.open(thumbnail)
@@ -72,21 +106,55 @@ def get_thumbnail(video_id):
     return thumbnail
 
 
-def set_contrast(image, desired_contrast=60):
-    current_contrast = np.std(np.array(image))
-    contrast_factor = desired_contrast / current_contrast
-    enhancer = ImageEnhance.Contrast(image)
-    image_with_desired_contrast = enhancer.enhance(contrast_factor)
-    return image_with_desired_contrast
+def measure_contrast(image):
+    return np.std(np.array(image))
+
+
+def measure_sharpness(image):
+    return np.var(np.array(image.filter(ImageFilter.DETAIL)))
+
+
+def enhance_thumbnail(image, desired_contrast=60, desired_sharpness=4000):
+    start = time.perf_counter()
+    image = image.convert('RGB')
+    
+    # Compute the contrast and the mean grey level of ImageEnhance.Contrast at full resolution from the histograms
+    mean = int(histogram_moments(image.convert('L'))[0] + 0.5)
+    contrast_factor = desired_contrast / max(histogram_moments(image)[1] ** 0.5, 1e-6)
+    
+    # Apply the contrast as a lookup table and measure the sharpness of the detail image it is applied to
+    image = image.point(build_contrast_table(mean, contrast_factor)).filter(ImageFilter.DETAIL)
+    sharpness_factor = desired_sharpness / max(histogram_moments(image)[1], 1e-6)
+    stats_time = time.perf_counter() - start
+    
+    # Sharpen the detail image that was already filtered to measure it, matching the ImageEnhance chain exactly
+    start = time.perf_counter()
+    image = ImageEnhance.Sharpness(image).enhance(sharpness_factor)
+    apply_time = time.perf_counter() - start
+    
+    # Return the enhanced image with the parameters and timings used
+    report = {
+        "mean": mean,
+        "contrast_factor": contrast_factor,
+        "sharpness_factor": sharpness_factor,
+        "timings": {"stats": stats_time, "apply": apply_time}
+    }
+    return image, report
+
+
+def histogram_moments(image):
+    # Mean and variance of the values of all bands, computed from the histogram instead of a float copy of the pixels
+    counts = np.array(image.histogram(), dtype=np.float64).reshape(-1, 256).sum(axis=0)
+    levels = np.arange(256)
+    mean = counts @ levels / counts.sum()
+    return mean, counts @ (levels - mean) ** 2 / counts.sum()
 
 
-def set_sharpness(image, desired_sharpness=4000):
-    image = image.filter(ImageFilter.DETAIL)
-    current_sharpness = np.var(np.array(image))
-    sharpness_factor = desired_sharpness / current_sharpness
-    enhancer = ImageEnhance.Sharpness(image)
-    image_with_desired_sharpness = enhancer.enhance(sharpness_factor)
-    return image_with_desired_sharpness
+def build_contrast_table(mean, factor):
+    # Blend each value with the mean grey level in single precision and truncate like ImageEnhance.Contrast, for all three bands
+    values = np.float32(mean) + np.float32(factor) * (np.arange(256, dtype=np.float32) - np.float32(mean))
+    table = np.clip(np.floor(values), 0, 255).astype(int).tolist()
+    return table * 3
 
 
 def add_text_to_thumbnail(animal, thumbnail):
@@ -99,18 +167,37 @@ def add_text_to_thumbnail(animal, thumbnail):
 
 
 def get_sized_font(text, draw, max_size=150, max_length=850):
-    font_size = max_size + 1
-    text_length = max_length + 1
-    while text_length > max_length and font_size > 0:
+    # Use the maximum size if the text already fits
+    text_length = draw.textlength(text, font=load_font(max_size))
+    if text_length <= max_length:
+        return load_font(max_size)
+    
+    # Text length scales roughly linearly with the font size, so start from the scaled size
+    font_size = max(int(max_size * max_length / text_length), 1)
+    
+    # Correct the estimate for hinting and kerning with a few measurements
+    while font_size > 1 and draw.textlength(text, font=load_font(font_size)) > max_length:
         font_size -= 1
-        font = ImageFont.truetype("video_generator/assets/fonts/font.ttf", size=font_size)
-        text_length = draw.textlength(text, font=font)
-    return font
+    while font_size < max_size and draw.textlength(text, font=load_font(font_size + 1)) <= max_length:
+        font_size += 1
+    return load_font(font_size)
+
+
+@lru_cache(maxsize=None)
+def load_font(size):
+    # Parse the font file once per size
+    return ImageFont.truetype(FONT_PATH, size=size)
+
+
+@lru_cache(maxsize=None)
+def load_logo(size=150):
+    # Decode and resize the logo once per size
+    png = Image.open(LOGO_PATH).convert("RGBA")
+    return png.resize((size, size))
 
 
 def add_logo_to_thumbnail(thumbnail):
-    png = Image.open("video_generator/assets/media/logo.png").convert("RGBA")
-    png = png.resize((150, 150))
+    png = load_logo()
     _, thumbnail_height = thumbnail.size
     _, png_height = png.size
     position = (25, thumbnail_height - png_height - 25)
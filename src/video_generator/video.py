@@ -1,73 +1,181 @@
 # video.py
 
+import os
+import time
+import random
 import tempfile
 import numpy as np
-from moviepy.editor import AudioFileClip, ImageClip, VideoFileClip, concatenate_videoclips
-from video_generator.util.metadata import get_title, get_description
-from video_generator.util.thumbnail import curate_thumbnail
+from concurrent.futures import ThreadPoolExecutor
+from video_generator.util.metadata import get_metadata
 from video_generator.util.client.youtube import upload_video, insert_captions
 from video_generator.util.client.google import translate
+from video_generator.util.client.ratelimit import TransientError
+from video_generator.util.renderer import FfmpegSlideshow, MoviePySlideshow
+from video_generator.util.image import open_image
+from video_generator.util.instrumentation import timed
+from config import CAPTION_CONCURRENCY, RENDER_BACKEND
+
+# Path to the intro clip played before the slideshow
+INTRO_PATH = "video_generator/assets/media/intro.mp4"
 
 # Define a list of language codes for translation and captioning
 LANGUAGE_CODES = ["en-GB", "hi-IN", "es-ES", "fr-FR", "cmn-CN"]
 
-def curate_video(animal, script, audio, images):
-    # Create the main video
-    video = create_video(audio, images)
-    
-    # Publish the video to YouTube
-    video_id = publish_video(animal, video)
+@timed("captions")
+def publish_captions(animal, script, video_id, languages=LANGUAGE_CODES, concurrency=CAPTION_CONCURRENCY):
+    # Translate and publish the captions for all languages concurrently
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {language: executor.submit(publish_caption, animal, script, video_id, language) for language in languages}
+        report = {language: future.result() for language, future in futures.items()}
     
-    # Curate the video thumbnail
-    curate_thumbnail(animal, video_id)
+    # Print a summary of the caption results
+    failed = [language for language, result in report.items() if result["status"] != "succeeded"]
+    if failed:
+        print(f"Failed to publish captions for: {', '.join(failed)}")
+    else:
+        print(f"Successfully published captions for {len(report)} languages!")
     
-    # Translate the script and insert captions for different languages
-    for language in LANGUAGE_CODES:
-        translation = translate(animal, script, language)
-        insert_captions(video_id, translation, language)
+    # Return the result of each language
+    return report
+
 
+def publish_caption(animal, script, video_id, language, retries=3, backoff=2):
+    start = time.time()
+    translation = None
+    for attempt in range(1, retries + 1):
+        try:
+            # Translate the script once, keeping the translation if inserting the captions has to be retried
+            if translation is None:
+                translation = translate(animal, script, language)
+            
+            # Insert the captions for the language, checking first whether a previous attempt already stored them
+            insert_captions(video_id, translation, language, retried=attempt > 1)
+            return {"status": "succeeded", "attempts": attempt, "error": None, "seconds": time.time() - start}
+        except Exception as e:
+            print(f"Failed to publish {language} captions (attempt {attempt}/{retries}): {e}")
+            error = str(e)
+            
+            # Give up on permanent errors, which another attempt would only repeat
+            if not isinstance(e, TransientError):
+                break
+            
+            # Wait with exponential backoff and jitter before retrying
+            if attempt < retries:
+                time.sleep(backoff * 2 ** (attempt - 1) + random.uniform(0, 1))
+    return {"status": "failed", "attempts": attempt, "error": error, "seconds": time.time() - start}
 
-def create_video(audio, images):
-    # Create a temporary WAV audio file
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-        audio.export(temp_file.name, format="wav")
-        audio_file_path = temp_file.name
-        audio_clip = AudioFileClip(audio_file_path)
+
+@timed("compose")
+def create_video(audio, images, backend=RENDER_BACKEND):
+    # Render the slideshow with a single ffmpeg filtergraph if selected
+    if backend == "ffmpeg":
+        print("Successfully created video!")
+        return FfmpegSlideshow(audio, images, INTRO_PATH)
+    
+    # Import MoviePy only when it renders the video, since importing it is slow
+    from moviepy.editor import ImageClip, concatenate_videoclips
+    from moviepy.audio.AudioClip import AudioArrayClip
+    
+    # Create an audio clip directly from the mixed samples, in stereo like the cached intro it is joined to
+    audio = audio.convert(audio.frame_rate, max(audio.channels, 2))
+    audio_clip = AudioArrayClip(audio.samples, fps=audio.frame_rate)
     
     # Calculate the duration per image based on the audio duration and the number of images
     duration_per_image = audio.duration_seconds / len(images)
     
-    # Create ImageClip objects for each image
-    image_clips = []
-    for image in images:
-        image_clip = ImageClip(np.array(image)).set_duration(duration_per_image)
-        image_clip = image_clip.crossfadein(1)
-        image_clip = image_clip.crossfadeout(1)
-        image_clips.append(image_clip)
-    
-    # Create an intro clip
-    intro_clip = VideoFileClip("video_generator/assets/media/intro.mp4")
-    intro_clip = intro_clip.fadeout(1)
+    if backend == "stream":
+        # Generate the frames lazily from the spooled images
+        video = create_streaming_clip(images, duration_per_image)
+    else:
+        # Create ImageClip objects for each image
+        image_clips = []
+        for image in images:
+            image_clip = ImageClip(np.array(open_image(image))).set_duration(duration_per_image)
+            image_clip = image_clip.crossfadein(1)
+            image_clip = image_clip.crossfadeout(1)
+            image_clips.append(image_clip)
+        
+        # Concatenate the image clips to create the main video
+        video = concatenate_videoclips(image_clips, method="compose")
     
-    # Concatenate the image clips to create the main video
-    video = concatenate_videoclips(image_clips, method="compose")
+    # Add the audio to the main video
     video = video.set_audio(audio_clip)
-    video = concatenate_videoclips([intro_clip, video], method="compose")
     
     # Print a success message
     print("Successfully created video!")
     
-    # Return the created video
-    return video
+    # Return the video, joined to the cached intro when it is rendered
+    return MoviePySlideshow(video, INTRO_PATH)
+
+
+def create_streaming_clip(images, duration_per_image, fade=1):
+    # Keep only the image of the current frame decoded
+    current = {}
+    
+    def make_frame(t):
+        # Find the image shown at the timestamp and decode it when it first appears
+        index = min(int(t // duration_per_image), len(images) - 1)
+        if index not in current:
+            current.clear()
+            current[index] = np.asarray(open_image(images[index]))
+        frame = current[index]
+        
+        # Fade the image in from and out to black
+        offset = t - index * duration_per_image
+        opacity = min(1, offset / fade, (duration_per_image - offset) / fade)
+        if opacity < 1:
+            return (frame * max(opacity, 0)).astype(np.uint8)
+        return frame
+    
+    # Return a clip whose frames are generated on demand
+    from moviepy.editor import VideoClip
+    return VideoClip(make_frame, duration=duration_per_image * len(images))
+
+
+@timed("render")
+def render_video(video, output_path=None, fps=24):
+    # Render into a managed temporary file unless an output path is given
+    temporary = output_path is None
+    if temporary:
+        file_descriptor, output_path = tempfile.mkstemp(suffix=".mp4")
+        os.close(file_descriptor)
+    
+    # Write the video file, removing the temporary file if rendering fails
+    artifact = VideoArtifact(output_path, temporary)
+    try:
+        video.write_videofile(output_path, fps=fps)
+    except Exception:
+        artifact.cleanup()
+        raise
+    
+    # Return the rendered video artifact
+    return artifact
+
+
+class VideoArtifact:
+    # Rendered video file, deleted on cleanup if it was rendered into a temporary file
+    def __init__(self, path, temporary=False):
+        self.path = path
+        self.temporary = temporary
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.cleanup()
+    
+    def cleanup(self):
+        if self.temporary and os.path.exists(self.path):
+            os.remove(self.path)
 
 
-def publish_video(animal, video):
-    # Get the title and description for the video
-    title = get_title(animal)
-    description = get_description(animal, title)
+def publish_video(animal, video_path, metadata=None):
+    # Get the title, description and tags for the video unless they were already generated
+    if metadata is None:
+        metadata = get_metadata(animal)
     
     # Upload the video to YouTube and get the video ID
-    video_id = upload_video(animal, title, description, video)
+    video_id = upload_video(animal, metadata["title"], metadata["description"], video_path, metadata.get("tags"))
     
     # Return the video ID
     return video_id